@@ -1,9 +1,21 @@
 import os
+import json
 import requests
 import sys
 import logging
+import argparse
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import commons.formatter
+from commons.jellyfin import iter_items
+from commons.jellyfin_client import get_client
+from commons.jellyfin_snapshot import LibrarySnapshot, DEFAULT_SNAPSHOT_PATH
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -12,10 +24,12 @@ load_dotenv()
 commons.formatter.configure_logging()
 
 # 🔹 CONFIGURE THESE
-JELLYFIN_SERVER = os.getenv("JELLYFIN_SERVER")
-API_KEY = os.getenv("API_KEY")
+# JELLYFIN_SERVER and API_KEY are read by commons.jellyfin_client
 USER_NAME = os.getenv("USER_NAME")
 USER_ID = ""  # Will be fetched later
+MAX_WORKERS = 8  # Concurrent per-series episode requests
+PLAYLIST_NAME = "Arrowverse"
+PLAYLIST_BATCH_SIZE = 100  # IDs per add/remove call, keeps the query string short
 
 # 🔹 List of Arrowverse series (https://en.wikipedia.org/wiki/Arrowverse)
 ARROWVERSE_SHOWS = [
@@ -24,20 +38,21 @@ ARROWVERSE_SHOWS = [
     "Vixen", "Freedom Fighters: The Ray", "DC's Stargirl"
 ]
 
+# Episode fields playlists can be ordered by, series_order is the position of the series in the playlist's list
+ORDER_KEYS = ("air_date", "series_order", "show", "season", "episode", "title")
+DEFAULT_TIE_BREAKS = ["series_order", "season", "episode"]
+
 
-def make_request(url, params=None):
+def make_request(path, params=None):
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response
+        return get_client().get(path, params=params)
     except requests.exceptions.RequestException as e:
         logging.error(f"Request failed: {e}")
         return None
 
 
 def get_user_id():
-    url = f"{JELLYFIN_SERVER}/Users?api_key={API_KEY}"
-    response = make_request(url)
+    response = make_request("/Users")
     if response:
         try:
             users = response.json()
@@ -54,68 +69,138 @@ def get_user_id():
     return None
 
 
-def get_episodes():
-    url = f"{JELLYFIN_SERVER}/Users/{USER_ID}/Items"
+def get_series_ids(series_names):
+    """Resolve series names to their Jellyfin IDs with one Series-only query."""
+    path = f"/Users/{USER_ID}/Items"
     params = {
         "Recursive": "true",
-        "IncludeItemTypes": "Episode",
-        "Fields": "PremiereDate,SeriesName,Name,Id,IndexNumber,ParentIndexNumber",
-        "Limit": 50,
-        "StartIndex": 0,
-        "api_key": API_KEY
+        "IncludeItemTypes": "Series",
+        "EnableImages": "false",
+        "EnableUserData": "false"
     }
 
-    episodes_ = []
-    while True:
-        response = make_request(url, params)
-        if not response:
-            break
+    series_ids = {}
+    try:
+        for series in iter_items(path, params):
+            name = series["Name"].strip()
+            if name in series_names:
+                series_ids[name] = series["Id"]
+    except requests.exceptions.JSONDecodeError:
+        logging.error("Failed to decode JSON! Check API URL and key.")
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Request failed: {e}")
 
-        try:
-            response_json = response.json()
-        except requests.exceptions.JSONDecodeError:
-            logging.error("Failed to decode JSON! Check API URL and key.")
-            break
+    for name in series_names:
+        if name not in series_ids:
+            logging.warning(f"Series not found in library: {name}")
+    return series_ids
 
-        if "Items" not in response_json:
-            logging.warning("No episodes found!")
-            break
 
-        for item in response_json["Items"]:
-            if item["SeriesName"].strip() in ARROWVERSE_SHOWS and "PremiereDate" in item:
+def get_series_episodes(series_id):
+    """Fetch the episodes of one series, only with the fields the playlist needs."""
+    path = f"/Shows/{series_id}/Episodes"
+    params = {
+        "UserId": USER_ID,
+        "Fields": "PremiereDate",
+        "EnableImages": "false",
+        "EnableUserData": "false"
+    }
+
+    episodes_ = []
+    try:
+        for item in iter_items(path, params):
+            if "PremiereDate" in item:
                 episodes_.append({
                     "id": item["Id"],
+                    "series_id": series_id,
                     "title": item["Name"],
                     "show": item["SeriesName"],
-                    "season": item["ParentIndexNumber"],
-                    "episode": item["IndexNumber"],
+                    "season": item.get("ParentIndexNumber"),
+                    "episode": item.get("IndexNumber"),
                     "air_date": item["PremiereDate"]
                 })
+    except requests.exceptions.JSONDecodeError:
+        logging.error("Failed to decode JSON! Check API URL and key.")
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Request failed: {e}")
 
-        if len(response_json["Items"]) < params["Limit"]:
-            break
+    return episodes_
 
-        params["StartIndex"] += params["Limit"]
-        sys.stdout.write(f"\r🔍 Fetched {len(episodes_)} Arrowverse episodes..., checking for more")
+
+def get_episodes(series_names, snapshot=None):
+    """
+    Episodes of all the given series in one pass, as {series_name: [episode, ...]}.
+    Read from the local snapshot if given, else fetched from the server one series per request.
+    """
+    series_ids = snapshot.series_ids(series_names) if snapshot is not None else get_series_ids(series_names)
+    if snapshot is not None:
+        for name in series_names:
+            if name not in series_ids:
+                logging.warning(f"Series not found in snapshot: {name}")
+
+    names = {series_id: name for name, series_id in series_ids.items()}
+    index = {name: [] for name in series_ids}
+    if snapshot is not None:
+        episodes_ = snapshot.episodes(names)
+        logging.info(f"🔍 Found {len(episodes_)} episodes in the snapshot.")
+    else:
+        episodes_ = []
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [executor.submit(get_series_episodes, series_id) for series_id in names]
+            for done, future in enumerate(as_completed(futures), 1):
+                episodes_.extend(future.result())
+                sys.stdout.write(f"\r🔍 Fetched {len(episodes_)} episodes ({done}/{len(futures)} series)...")
+                sys.stdout.flush()
+
+        sys.stdout.write(f"\r🔍 Fetched {len(episodes_)} episodes.{' ' * 20}\n")
         sys.stdout.flush()
 
-    sys.stdout.write(f"\r🔍 Fetched {len(episodes_)} Arrowverse episodes.{' ' * 20}\n")
-    sys.stdout.flush()
+    for episode in episodes_:
+        index[names[episode["series_id"]]].append(episode)
+    return index
+
+
+def load_playlists(path):
+    """Read playlist definitions from a JSON or YAML file, see DESC.md for the format."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise RuntimeError("PyYAML is required to read YAML playlist files.")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+
+    playlists = config.get("playlists", []) if isinstance(config, dict) else config
+    for playlist in playlists:
+        if not playlist.get("name") or not playlist.get("series"):
+            raise ValueError(f"Every playlist needs a name and a list of series: {playlist}")
+        for key in [playlist.get("order_by", "air_date")] + playlist.get("tie_breaks", DEFAULT_TIE_BREAKS):
+            if key not in ORDER_KEYS:
+                raise ValueError(f"Unknown ordering key '{key}' in playlist {playlist['name']}, use one of {ORDER_KEYS}")
+    return playlists
 
-    sorted_episodes = sorted(episodes_, key=lambda x: (x['air_date']))
 
-    return sorted_episodes
+def order_playlist(playlist, index):
+    """Episode IDs of one playlist definition, sorted by its ordering key and tie-breaks."""
+    keys = [playlist.get("order_by", "air_date")] + playlist.get("tie_breaks", DEFAULT_TIE_BREAKS)
+    episodes_ = []
+    for series_order, name in enumerate(playlist["series"]):
+        for episode in index.get(name, []):
+            episodes_.append(dict(episode, series_order=series_order))
+
+    # Missing values sort last instead of breaking the comparison
+    episodes_.sort(key=lambda x: [(False, x[key]) if x[key] is not None else (True,) for key in keys])
+    return [ep["id"] for ep in episodes_]
 
 
 def get_playlist_id(playlist_name):
-    url = f"{JELLYFIN_SERVER}/Users/{USER_ID}/Items"
+    path = f"/Users/{USER_ID}/Items"
     params = {
         "IncludeItemTypes": "Playlist",
-        "Recursive": "true",
-        "api_key": API_KEY
+        "Recursive": "true"
     }
 
-    response = make_request(url, params)
+    response = make_request(path, params)
     if response:
         playlists = response.json().get("Items", [])
         for playlist in playlists:
@@ -125,9 +210,7 @@ def get_playlist_id(playlist_name):
     return None
 
 
-def create_playlist(_episode_ids):
-    playlist_name = "Arrowverse"
-    playlist_url = f"{JELLYFIN_SERVER}/Playlists?api_key={API_KEY}"
+def create_playlist(_episode_ids, playlist_name=PLAYLIST_NAME):
     playlist_data = {
         "Name": playlist_name,
         "UserId": USER_ID,
@@ -135,22 +218,188 @@ def create_playlist(_episode_ids):
     }
 
     try:
-        response = requests.post(playlist_url, json=playlist_data)
-        response.raise_for_status()
+        get_client().post("/Playlists", json=playlist_data)
         logging.info("Playlist created successfully!")
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to create playlist: {e}")
 
 
+def get_playlist_entries(playlist_id):
+    """Return [(item_id, entry_id), ...] in playlist order, entry_id being the PlaylistItemId."""
+    path = f"/Playlists/{playlist_id}/Items"
+    params = {
+        "UserId": USER_ID,
+        "EnableImages": "false",
+        "EnableUserData": "false"
+    }
+    return [(item["Id"], item["PlaylistItemId"]) for item in iter_items(path, params)]
+
+
+def add_to_playlist(playlist_id, item_ids):
+    path = f"/Playlists/{playlist_id}/Items"
+    for start in range(0, len(item_ids), PLAYLIST_BATCH_SIZE):
+        params = {"Ids": ",".join(item_ids[start:start + PLAYLIST_BATCH_SIZE]), "UserId": USER_ID}
+        get_client().post(path, params=params)
+
+
+def remove_from_playlist(playlist_id, entry_ids):
+    path = f"/Playlists/{playlist_id}/Items"
+    for start in range(0, len(entry_ids), PLAYLIST_BATCH_SIZE):
+        params = {"EntryIds": ",".join(entry_ids[start:start + PLAYLIST_BATCH_SIZE])}
+        get_client().delete(path, params=params)
+
+
+def move_in_playlist(playlist_id, entry_id, new_index):
+    path = f"/Playlists/{playlist_id}/Items/{entry_id}/Move/{new_index}"
+    get_client().post(path)
+
+
+def plan_changes(entries, desired_ids):
+    """Entries to remove (no longer wanted or duplicated) and item IDs to append."""
+    wanted = set(desired_ids)
+    present = set()
+    removals = []
+    for item_id, entry_id in entries:
+        if item_id in wanted and item_id not in present:
+            present.add(item_id)
+        else:
+            removals.append(entry_id)
+    additions = [item_id for item_id in desired_ids if item_id not in present]
+    return removals, additions
+
+
+def longest_increasing_run(ranks):
+    """Return the set of values forming a longest increasing subsequence of ranks."""
+    tails, tail_indices, previous = [], [], [None] * len(ranks)
+    for index, rank in enumerate(ranks):
+        position = bisect_left(tails, rank)
+        if position == len(tails):
+            tails.append(rank)
+            tail_indices.append(index)
+        else:
+            tails[position] = rank
+            tail_indices[position] = index
+        previous[index] = tail_indices[position - 1] if position else None
+
+    keep = set()
+    index = tail_indices[-1] if tail_indices else None
+    while index is not None:
+        keep.add(ranks[index])
+        index = previous[index]
+    return keep
+
+
+def plan_moves(entries, desired_ids):
+    """
+    Moves turning the playlist order into desired_ids, as [(entry_id, new_index), ...] to apply in sequence.
+    Entries on a longest run already in desired order stay put, every other one is placed right after
+    its desired predecessor, so the number of moves is minimal.
+    """
+    position = {item_id: rank for rank, item_id in enumerate(desired_ids)}
+    entries = [(item_id, entry_id) for item_id, entry_id in entries if item_id in position]
+    entry_ids = dict(entries)
+    desired_ids = [item_id for item_id in desired_ids if item_id in entry_ids]
+    position = {item_id: rank for rank, item_id in enumerate(desired_ids)}
+
+    order = [item_id for item_id, _ in entries]
+    keep = longest_increasing_run([position[item_id] for item_id in order])
+    moves = []
+    for rank, item_id in enumerate(desired_ids):
+        if rank in keep:
+            continue
+        order.remove(item_id)
+        new_index = order.index(desired_ids[rank - 1]) + 1 if rank else 0
+        order.insert(new_index, item_id)
+        moves.append((entry_ids[item_id], new_index))
+    return moves
+
+
+def sync_playlist(_episode_ids, playlist_name=PLAYLIST_NAME):
+    """Bring an existing playlist in line with _episode_ids with as few calls as possible, create it if missing."""
+    playlist_id = get_playlist_id(playlist_name)
+    if playlist_id is None:
+        create_playlist(_episode_ids, playlist_name)
+        return
+
+    try:
+        entries = get_playlist_entries(playlist_id)
+        removals, additions = plan_changes(entries, _episode_ids)
+        remove_from_playlist(playlist_id, removals)
+        add_to_playlist(playlist_id, additions)
+        if removals or additions:
+            entries = get_playlist_entries(playlist_id)
+
+        moves = plan_moves(entries, _episode_ids)
+        for entry_id, new_index in moves:
+            move_in_playlist(playlist_id, entry_id, new_index)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Failed to sync playlist: {e}")
+        return
+
+    logging.info(f"Playlist synced: {len(additions)} added, {len(removals)} removed, {len(moves)} moved.")
+
+
 if __name__ == "__main__":
-    logging.info(f"Checking Jellyfin user for {USER_NAME}...")
-    USER_ID = get_user_id()
+    parser = argparse.ArgumentParser(description="Build Jellyfin playlists of franchises in air date order.")
+    parser.add_argument(
+        '--playlist',
+        default=PLAYLIST_NAME,
+        help=f'Name of the Arrowverse playlist when no --config is given (default: {PLAYLIST_NAME}).'
+    )
+    parser.add_argument(
+        '--config',
+        help='JSON or YAML file declaring the playlists to build, the Arrowverse playlist is built without it.'
+    )
+    parser.add_argument(
+        '--recreate',
+        action='store_true',
+        help='Always create a new playlist instead of syncing the existing one.'
+    )
+    parser.add_argument(
+        '--no-snapshot',
+        action='store_true',
+        help='Query the server directly instead of the local library snapshot.'
+    )
+    parser.add_argument(
+        '--snapshot-path',
+        default=DEFAULT_SNAPSHOT_PATH,
+        help=f'Library snapshot database (default: {DEFAULT_SNAPSHOT_PATH}).'
+    )
+    args = parser.parse_args()
 
-    logging.info("Fetching Arrowverse episodes from Jellyfin...")
-    episodes = get_episodes()
+    if args.config:
+        playlists = load_playlists(args.config)
+    else:
+        playlists = [{"name": args.playlist, "series": ARROWVERSE_SHOWS}]
+    series_names = list(dict.fromkeys(name for playlist in playlists for name in playlist["series"]))
+
+    if args.no_snapshot:
+        logging.info(f"Checking Jellyfin user for {USER_NAME}...")
+        USER_ID = get_user_id()
 
-    if not episodes:
-        logging.warning("No Arrowverse episodes found!")
+        logging.info(f"Fetching episodes of {len(series_names)} series from Jellyfin...")
+        episodes = get_episodes(series_names)
     else:
-        episode_ids = [ep["id"] for ep in episodes]
-        create_playlist(episode_ids)
+        with LibrarySnapshot(args.snapshot_path) as library:
+            try:
+                logging.info(f"Updated {library.sync()} items in the library snapshot.")
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Snapshot sync failed, using the local copy: {e}")
+
+            USER_ID = library.user_id(USER_NAME)
+            if USER_ID is None:
+                logging.warning(f"User not found: {USER_NAME}")
+                raise NameError("User not found!")
+            episodes = get_episodes(series_names, library)
+
+    for playlist in playlists:
+        episode_ids = order_playlist(playlist, episodes)
+        if not episode_ids:
+            logging.warning(f"No episodes found for playlist {playlist['name']}!")
+        elif args.recreate:
+            create_playlist(episode_ids, playlist["name"])
+        else:
+            sync_playlist(episode_ids, playlist["name"])
+
+    for line in get_client().latency.report():
+        logging.info(f"⏱️ {line}")
@@ -1,10 +1,14 @@
-import requests
+import os
+from commons.jellyfin_client import JellyfinClient
 
-JELLYFIN_SERVER = "http://server_address:8096"
-API_KEY = "api_key"
+JELLYFIN_SERVER = os.getenv("JELLYFIN_SERVER", "http://server_address:8096")
+API_KEY = os.getenv("API_KEY", "api_key")
+ENDPOINT = "/Users/Public"
 
-url = f"{JELLYFIN_SERVER}/Users/Public?api_key={API_KEY}"
-response = requests.get(url)
+with JellyfinClient(JELLYFIN_SERVER, API_KEY) as client:
+    response = client.request("GET", ENDPOINT)
 
-print("Status Code:", response.status_code)
-print("Response Text:", response.text)
+    print("Status Code:", response.status_code)
+    print("Response Text:", response.text)
+    for line in client.latency.report():
+        print(line)
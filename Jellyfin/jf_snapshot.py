@@ -0,0 +1,33 @@
+import logging
+import argparse
+import requests
+import commons.formatter
+from commons.jellyfin_client import get_client
+from commons.jellyfin_snapshot import LibrarySnapshot, DEFAULT_SNAPSHOT_PATH
+
+# Configure logging
+commons.formatter.configure_logging()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the local snapshot of the Jellyfin library.")
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Pull every item again instead of only those saved since the last sync.'
+    )
+    parser.add_argument(
+        '--path',
+        default=DEFAULT_SNAPSHOT_PATH,
+        help=f'Snapshot database (default: {DEFAULT_SNAPSHOT_PATH}).'
+    )
+    args = parser.parse_args()
+
+    with LibrarySnapshot(args.path) as snapshot:
+        try:
+            logging.info(f"Stored {snapshot.sync(full=args.full)} changed items.")
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Snapshot sync failed: {e}")
+        logging.info(snapshot.summary())
+
+    for line in get_client().latency.report():
+        logging.info(f"⏱️ {line}")
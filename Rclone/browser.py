@@ -1,6 +1,15 @@
 import paramiko
 from dotenv import load_dotenv
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import os
+import argparse
+import time
+import shlex
+import threading
+from remote_index import RemoteIndex, parse_lsjson_lines
+from transfer_queue import TransferQueue, RC_ADDR, DEFAULT_TRANSFERS, DEFAULT_CHECKERS
 
 
 load_dotenv()
@@ -10,23 +19,103 @@ SERVER_IP = os.getenv("SERVER_IP")
 USERNAME = os.getenv("SERVER_USERNAME")
 PASSWORD = os.getenv("SERVER_PASSWORD")
 
-# Initialize SSH client
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect(SERVER_IP, username=USERNAME, password=PASSWORD)
+LISTING_TTL = 120  # seconds a directory listing is served from memory
+MAX_CACHED_LISTINGS = 32  # least recently used listings beyond this are dropped
+PAGE_SIZE = 50  # menu entries per page
+PREFETCH_WORKERS = 2  # concurrent background listings, low enough to stay clear of remote API throttling
+PREFETCH_COUNT = 5  # subdirectories of the current view listed ahead of time
+KEEPALIVE_INTERVAL = 30  # seconds between SSH keepalives, keeps NAT mappings of idle sessions open
+CONNECT_TIMEOUT = 15
+KNOWN_HOSTS_PATH = os.path.join(os.path.expanduser("~"), ".cache", "servertools", "known_hosts")
+# The incremental refresh still walks every directory of the remote (--max-age only filters objects),
+# so it costs a full API listing each time and is off unless asked for with --index-refresh
+DEFAULT_INDEX_REFRESH = 0  # minutes between background index refreshes, 0 disables them
+INDEX_MAX_AGE = 24 * 3600  # older indexes are rebuilt in full, which also drops deleted objects
 
+# size is -1 for directories and for objects of unknown size, mod_time is "YYYY-MM-DD HH:MM:SS"
+Entry = namedtuple("Entry", ["name", "size", "mod_time"])
 
-def run_command(command, stream_output=False):
-    stdin, stdout, stderr = ssh.exec_command(command)
 
-    if stream_output:
-        for line in iter(stdout.readline, ""):
-            print(line, end="")  # Print each line in real-time
-        return "", stderr.read().decode()
+class SSHSession:
+    """
+    SSH connection opened on first use and reopened whenever its transport has died.
+    Commands may run from several threads at once, each gets its own channel on the one transport.
+    Host keys accepted on first connect are remembered in KNOWN_HOSTS_PATH.
+    """
+
+    def __init__(self, host, username, password, keepalive=KEEPALIVE_INTERVAL, known_hosts=KNOWN_HOSTS_PATH):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.known_hosts = known_hosts
+        self.client = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        os.makedirs(os.path.dirname(self.known_hosts), exist_ok=True)
+        open(self.known_hosts, "a").close()
+        client.load_host_keys(self.known_hosts)  # AutoAddPolicy saves new keys back to this file
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(self.host, username=self.username, password=self.password, timeout=CONNECT_TIMEOUT)
+        client.get_transport().set_keepalive(self.keepalive)
+        return client
+
+    def connected(self):
+        with self.lock:
+            transport = self.client.get_transport() if self.client else None
+            if transport is None or not transport.is_active():
+                if self.client:
+                    self.client.close()
+                self.client = self._connect()
+            return self.client
+
+    def _drop(self, client):
+        with self.lock:
+            if self.client is client:
+                self.client.close()
+                self.client = None
+
+    def exec_command(self, command):
+        """exec_command on the live connection, reconnecting once if the channel cannot be opened."""
+        for attempt in range(2):
+            client = self.connected()
+            try:
+                return client.exec_command(command)
+            except (paramiko.SSHException, EOFError, OSError):
+                if attempt:
+                    raise
+                self._drop(client)
+
+    def close(self):
+        with self.lock:
+            if self.client:
+                self.client.close()
+                self.client = None
+
+
+ssh = SSHSession(SERVER_IP, USERNAME, PASSWORD)
+
 
+def run_command(command):
+    stdin, stdout, stderr = ssh.exec_command(command)
     return stdout.read().decode(), stderr.read().decode()
 
 
+def iter_command_lines(command):
+    """
+    Yield the output lines of a command as they arrive instead of reading it whole.
+    Raises RuntimeError with its stderr once the output ends if the command failed.
+    """
+    stdin, stdout, stderr = ssh.exec_command(command)
+    for line in stdout:
+        yield line
+    if stdout.channel.recv_exit_status() != 0:
+        raise RuntimeError(stderr.read().decode().strip() or f"command failed: {command}")
+
+
 def list_remotes():
     print("Fetching available rclone remotes...")
     stdout, stderr = run_command("rclone listremotes")
@@ -37,35 +126,318 @@ def list_remotes():
     return [r.strip(":") for r in remotes]
 
 
-def list_directory(remote, path=""):
+class Listing:
+    """
+    Entries of one directory as (entry, is_dir), appended as the rclone output arrives so the
+    first page can be shown before the whole directory is listed. Entries keep their arrival
+    order, so pages already shown never shift. Only a listing that completed before anyone
+    viewed it is sorted, directories first.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.error = None
+        self.complete = False
+        self.claimed = False
+        self.viewed = False
+        self.created = time.monotonic()
+        self.condition = threading.Condition()
+
+    @classmethod
+    def of(cls, directories, files):
+        listing = cls()
+        listing.entries = [(d, True) for d in directories] + [(f, False) for f in files]
+        listing.complete = listing.claimed = True
+        return listing
+
+    def claim(self):
+        """True for the one caller that should load this listing."""
+        with self.condition:
+            claimed, self.claimed = self.claimed, True
+        return not claimed
+
+    def add(self, entry, is_dir):
+        with self.condition:
+            self.entries.append((entry, is_dir))
+            if len(self.entries) % PAGE_SIZE == 0:
+                self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            if not self.viewed:
+                self.entries.sort(key=lambda item: (not item[1], item[0]))
+            self.error = error
+            self.complete = True
+            self.condition.notify_all()
+
+    def wait_for(self, count):
+        """Block until count entries are in or the listing is complete."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.complete or len(self.entries) >= count)
+
+    def view(self):
+        """Snapshot of the (entry, is_dir) pairs, from now on their order stays fixed."""
+        with self.condition:
+            self.viewed = True
+            return list(self.entries)
+
+    def split(self):
+        """(directories, files) of a listing, without fixing its order."""
+        with self.condition:
+            return ([entry for entry, is_dir in self.entries if is_dir],
+                    [entry for entry, is_dir in self.entries if not is_dir])
+
+
+class ListingCache:
+    """
+    Directory listings by (remote, path), kept until they are older than ttl seconds.
+    At most MAX_CACHED_LISTINGS are held, the least recently used go first.
+    """
+
+    def __init__(self, ttl=LISTING_TTL, size=MAX_CACHED_LISTINGS):
+        self.ttl = ttl
+        self.size = size
+        self.listings = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_create(self, remote, path):
+        """Return (listing, created), a new empty listing is cached if there is no fresh one."""
+        key = (remote, path)
+        with self.lock:
+            listing = self.listings.get(key)
+            if listing is not None and time.monotonic() - listing.created < self.ttl:
+                self.listings.move_to_end(key)
+                return listing, False
+
+            listing = self.listings[key] = Listing()
+            self.listings.move_to_end(key)
+            while len(self.listings) > self.size:
+                self.listings.popitem(last=False)
+            return listing, True
+
+    def invalidate(self, remote, path, listing=None):
+        with self.lock:
+            if listing is None or self.listings.get((remote, path)) is listing:
+                self.listings.pop((remote, path), None)
+
+
+listing_cache = ListingCache()
+
+
+def join_path(path, name):
+    return f"{path}/{name}" if path else name
+
+
+def load_listing(listing, remote, path):
+    """Stream `rclone lsjson` of one directory into listing, entry by entry."""
     list_path = f"{remote}:{path}" if path else f"{remote}:"
-    stdout, stderr = run_command(f"rclone lsf '{list_path}' --dirs-only")
-    directories = stdout.strip().split("\n") if stdout else []
-    stdout, stderr = run_command(f"rclone lsf '{list_path}' --files-only")
-    files = stdout.strip().split("\n") if stdout else []
-    return directories, files
+    try:
+        for item in parse_lsjson_lines(iter_command_lines(f"rclone lsjson {shlex.quote(list_path)}")):
+            mod_time = item.get("ModTime", "")[:19].replace("T", " ")
+            if item.get("IsDir"):
+                listing.add(Entry(item["Name"], -1, mod_time), True)
+            else:
+                listing.add(Entry(item["Name"], item.get("Size", -1), mod_time), False)
+    except (RuntimeError, paramiko.SSHException, EOFError, OSError) as e:
+        listing_cache.invalidate(remote, path, listing)
+        listing.finish(str(e) or "listing failed")
+        return
 
+    listing.finish()
+    if remote in indexes:
+        directories, files = listing.split()
+        indexes[remote].update_directory(path, [d.name for d in directories], files)
 
-def download_item(remote, path, destination):
-    list_path = f"{remote}:{path}".replace("//", "/")
 
-    # Ensure the destination directory exists
-    run_command(f"mkdir -p '{os.path.dirname(destination)}'")
+class Prefetcher:
+    """
+    Lists subdirectories in the background while the user reads the menu, each listing
+    runs on its own channel of the SSH connection. Work queued for a view the user has
+    already left is dropped, a listing the user opens before its turn is loaded right away.
+    """
 
-    command = f"rclone copy '{list_path}' '{destination}' --progress"
-    print(f"Downloading {list_path} to {destination} (on the server)...")
+    def __init__(self, workers=PREFETCH_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.queued = []
 
-    _, stderr = run_command(command, stream_output=True)  # Stream output
+    def schedule(self, remote, paths):
+        for future, listing, key in self.queued:
+            # A listing whose load never started is still empty, left cached it would hide the
+            # directory from the next schedule and take a slot from a real listing
+            if future.cancel() and not listing.claimed:
+                listing_cache.invalidate(*key, listing)
+        self.queued = []
+        for path in paths:
+            listing, _ = listing_cache.get_or_create(remote, path)
+            if not listing.claimed:
+                future = self.executor.submit(self._load, listing, remote, path)
+                self.queued.append((future, listing, (remote, path)))
 
-    if stderr:
-        print("Error:", stderr)
+    @staticmethod
+    def _load(listing, remote, path):
+        if listing.claim():
+            load_listing(listing, remote, path)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+prefetcher = Prefetcher()
+
+
+indexes = {}  # remote -> RemoteIndex
+
+
+def build_index(index, full=True):
+    """List the remote recursively into the index, incrementally only objects modified since the last run."""
+    command = f"rclone lsjson -R {shlex.quote(index.remote + ':')}"
+    if full:
+        index.build(parse_lsjson_lines(iter_command_lines(command)))
     else:
-        print("\nDownload complete!")
+        max_age = int(time.time() - index.refreshed_at) + 60
+        index.merge(parse_lsjson_lines(iter_command_lines(f"{command} --files-only --max-age {max_age}s")))
+    index.save()
+
+
+def refresh_indexes(interval):
+    """Background loop keeping the loaded indexes current, every pass lists each remote in full."""
+    while True:
+        time.sleep(interval)
+        for index in list(indexes.values()):
+            try:
+                build_index(index, full=time.time() - index.built_at > INDEX_MAX_AGE)
+            except Exception as e:
+                print(f"\nIndex refresh of {index.remote} failed: {e}")
+
+
+def open_index(remote, rebuild=False, refresh_interval=0):
+    """
+    Load the saved index of a remote or build it. With a refresh_interval in seconds it is also
+    refreshed in the background, otherwise only directories refreshed with [R] and rebuilds change it.
+    """
+    index = indexes.get(remote) or RemoteIndex(remote)
+    if rebuild or not index.load():
+        print(f"Indexing {remote} (this lists the whole remote once)...")
+        try:
+            build_index(index)
+        except (RuntimeError, paramiko.SSHException, EOFError, OSError) as e:
+            print("Error:", e)
+            return indexes.get(remote)
+    print(f"Indexed {index.files} files of {remote}.")
+    age = time.time() - index.refreshed_at
+    if not refresh_interval and age > INDEX_MAX_AGE:
+        print(f"The index is {age / 3600:.0f} hours old, [I] rebuilds it.")
 
+    if not indexes and refresh_interval:
+        threading.Thread(target=refresh_indexes, args=(refresh_interval,), name="index-refresh", daemon=True).start()
+    indexes[remote] = index
+    return index
+
+
+def list_directory(remote, path="", refresh=False):
+    """Listing of a directory, served from the index or cache or loading in the background."""
+    if not refresh and remote in indexes:
+        indexed = indexes[remote].listing(path)
+        if indexed is not None:
+            return Listing.of([Entry(*d) for d in indexed[0]], [Entry(*f) for f in indexed[1]])
+
+    if refresh:
+        listing_cache.invalidate(remote, path)
+    listing, _ = listing_cache.get_or_create(remote, path)
+    if listing.claim():
+        threading.Thread(target=load_listing, args=(listing, remote, path), daemon=True).start()
+    return listing
+
+
+def format_size(size):
+    if size < 0:
+        return "?"
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+transfers = TransferQueue(run_command)
+
+
+def parse_selection(text, count):
+    """Turn "1,3,5-8" into sorted 0-based indexes, raises ValueError for anything outside 1..count."""
+    indexes = set()
+    for part in text.replace(" ", "").split(","):
+        first, _, last = part.partition("-")
+        first, last = int(first), int(last or first)
+        if not 1 <= first <= last <= count:
+            raise ValueError(f"{part} is not within 1-{count}")
+        indexes.update(range(first - 1, last))
+    return sorted(indexes)
+
+
+def queue_transfers(remote, path, entries):
+    """Submit (entry, is_dir) pairs as rclone rc jobs, they run on the server while browsing goes on."""
+    destination = input("Enter destination folder (server): ").strip()
+    if not destination:
+        return
+    for entry, is_dir in entries:
+        source = join_path(path, entry.name)
+        try:
+            jobid = transfers.submit(remote, source, is_dir, destination)
+        except (RuntimeError, paramiko.SSHException, EOFError, OSError) as e:
+            print("Error:", e)
+            return
+        print(f"Queued job {jobid}: {remote}:{source} -> {destination}")
+
+
+def transfer_summary():
+    if not transfers.jobs and not transfers.stats:
+        return None
+    stats = transfers.stats
+    summary = (f"Transfers: {len(transfers.jobs)} running, {format_size(stats.get('bytes', 0))} of "
+               f"{format_size(stats.get('totalBytes', 0))} at {format_size(int(stats.get('speed', 0)))}/s")
+    if stats.get("eta"):
+        summary += f", ETA {int(stats['eta'])}s"
+    if transfers.error:
+        summary += f" (last poll failed: {transfers.error})"
+    return summary
+
+
+def report_finished():
+    for description, success, error in transfers.take_finished():
+        print(f"Transfer of {description} {'complete' if success else f'failed: {error}'}")
+
+
+def show_transfers():
+    try:
+        transfers.poll()
+    except (RuntimeError, paramiko.SSHException, EOFError, OSError) as e:
+        print("Error:", e)
+    print(transfer_summary() or "No transfers.")
+    for jobid, description in sorted(transfers.running().items()):
+        print(f"  job {jobid}: {description}")
+    report_finished()
+
+
+def search_index(index, path):
+    """Search prompt, returns the path to browse next: the picked result's directory or the current one."""
+    pattern = input("Search (substring or glob): ").strip()
+    if not pattern:
+        return path
+
+    started = time.monotonic()
+    results = index.search(pattern)
+    print(f"{len(results)} matches in {(time.monotonic() - started) * 1000:.0f} ms")
+    for i, (result, is_dir) in enumerate(results, 1):
+        print(f"[{i}] [{'D' if is_dir else 'F'}] {result}")
+
+    choice = input("Open result (Enter to stay): ")
+    if choice.isdigit() and 0 < int(choice) <= len(results):
+        result, is_dir = results[int(choice) - 1]
+        return result if is_dir else "/".join(result.split("/")[:-1])
+    return path
 
 
 # Main interaction loop
-def main():
+def main(use_index=False, index_refresh=DEFAULT_INDEX_REFRESH):
     remotes = list_remotes()
     if not remotes:
         print("No remotes found. Exiting...")
@@ -82,38 +454,138 @@ def main():
 
     remote = remotes[choice]
     path = ""
+    if use_index:
+        open_index(remote, refresh_interval=index_refresh * 60)
 
+    refresh = False
+    shown_path, page = None, 0
     while True:
-        directories, files = list_directory(remote, path)
+        if path != shown_path:
+            shown_path, page = path, 0
+        listing = list_directory(remote, path, refresh)
+        refresh = False
+
+        # Only the page about to be shown has to be loaded, the rest keeps streaming in
+        listing.wait_for((page + 1) * PAGE_SIZE)
+        entries = listing.view()
+        page = min(page, max(0, len(entries) - 1) // PAGE_SIZE)
+        pages = max(1, -(-len(entries) // PAGE_SIZE))
 
-        print("\nBrowsing:", remote, path)
+        report_finished()
+        summary = transfer_summary()
+        if summary:
+            print(f"\n{summary}")
+        if listing.error:
+            print("Error:", listing.error)
+
+        status = f"{len(entries)} entries, page {page + 1}/{pages}{'+' if not listing.complete else ''}"
+        print("\nBrowsing:", remote, path, f"({status})")
         print("[0] .. (Go Back)")
-        for i, d in enumerate(directories, 1):
-            print(f"[{i}] [D] {d}")
-        for i, f in enumerate(files, len(directories) + 1):
-            print(f"[{i}] [F] {f}")
+        for i in range(page * PAGE_SIZE, min(len(entries), (page + 1) * PAGE_SIZE)):
+            entry, is_dir = entries[i]
+            if is_dir:
+                print(f"[{i + 1}] [D] {entry.name}")
+            else:
+                print(f"[{i + 1}] [F] {entry.name}  ({format_size(entry.size)}, {entry.mod_time})")
+        if (page + 1) * PAGE_SIZE < len(entries) or not listing.complete:
+            print("[N] Next page")
+        if page:
+            print("[P] Previous page")
+        print("[Q] Queue transfers (e.g. 1,3,5-8)")
+        print("[T] Transfers")
+        print("[R] Refresh")
+        print("[I] Index remote" if remote not in indexes else "[I] Rebuild index")
+        if remote in indexes:
+            print("[S] Search")
         print("[X] Exit")
 
+        if remote not in indexes:
+            directories = (entry.name for entry, is_dir in entries if is_dir)
+            prefetcher.schedule(remote, [join_path(path, name) for name in islice(directories, PREFETCH_COUNT)])
+
         choice = input("Enter choice: ")
         if choice.lower() == "x":
             break
+        elif choice.lower() == "r":
+            refresh = True
+        elif choice.lower() == "n":
+            page += 1
+        elif choice.lower() == "p":
+            page = max(0, page - 1)
+        elif choice.lower() == "t":
+            show_transfers()
+        elif choice.lower() == "q":
+            try:
+                selection = parse_selection(input("Select entries: "), len(entries))
+            except ValueError as e:
+                print("Invalid selection:", e)
+                continue
+            queue_transfers(remote, path, [entries[i] for i in selection])
+        elif choice.lower() == "i":
+            open_index(remote, rebuild=remote in indexes, refresh_interval=index_refresh * 60)
+        elif choice.lower() == "s" and remote in indexes:
+            path = search_index(indexes[remote], path)
         elif choice == "0":
             path = "/".join(path.split("/")[:-1]) if path else ""
         elif choice.isdigit():
             index = int(choice) - 1
-            if index < len(directories):
-                path = f"{path}/{directories[index]}" if path else directories[index]
-            elif index < len(directories) + len(files):
-                file_to_download = files[index - len(directories)]
-                destination = input("Enter destination folder (server): ")
-                download_item(remote, f"{path}/{file_to_download}" if path else file_to_download, destination)
-            else:
+            if index >= len(entries):
                 print("Invalid choice.")
+            elif entries[index][1]:
+                path = join_path(path, entries[index][0].name)
+            else:
+                queue_transfers(remote, path, [entries[index]])
         else:
             print("Invalid input.")
 
+    if transfers.jobs:
+        print(f"{len(transfers.jobs)} transfers keep running on the server (rclone rcd at {transfers.rc_addr}).")
+    # Directories refreshed with [R] were merged into the index in memory only
+    for index in indexes.values():
+        index.save()
+    prefetcher.shutdown()
     ssh.close()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Browse rclone remotes of the server over SSH.")
+    parser.add_argument(
+        '--keepalive',
+        type=int,
+        default=KEEPALIVE_INTERVAL,
+        help=f'Seconds between SSH keepalive packets, 0 disables them (default: {KEEPALIVE_INTERVAL}).'
+    )
+    parser.add_argument(
+        '--index',
+        action='store_true',
+        help='Index the whole remote once (rclone lsjson -R) and browse and search it locally.'
+    )
+    parser.add_argument(
+        '--index-refresh',
+        type=int,
+        default=DEFAULT_INDEX_REFRESH,
+        help='Minutes between background refreshes of the index, each one lists the whole remote again '
+             f'(default: {DEFAULT_INDEX_REFRESH}, off).'
+    )
+    parser.add_argument(
+        '--transfers',
+        type=int,
+        default=DEFAULT_TRANSFERS,
+        help=f'Parallel file transfers per queued job (default: {DEFAULT_TRANSFERS}).'
+    )
+    parser.add_argument(
+        '--checkers',
+        type=int,
+        default=DEFAULT_CHECKERS,
+        help=f'Parallel checkers per queued job (default: {DEFAULT_CHECKERS}).'
+    )
+    parser.add_argument(
+        '--rc-addr',
+        default=RC_ADDR,
+        help=f'Address of rclone rcd on the server, started there if nothing answers (default: {RC_ADDR}).'
+    )
+    args = parser.parse_args()
+
+    ssh.keepalive = args.keepalive
+    transfers.transfers, transfers.checkers, transfers.rc_addr = args.transfers, args.checkers, args.rc_addr
+    main(args.index, args.index_refresh)
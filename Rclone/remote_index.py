@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import time
+import fnmatch
+import threading
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "servertools", "rclone_index")
+SEARCH_LIMIT = 100
+
+
+def parse_lsjson_lines(lines):
+    """Yield the items of `rclone lsjson` output as it arrives, rclone prints one object per line."""
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if not line.startswith("{"):
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+class RemoteIndex:
+    """
+    Path trie of a whole remote: directories are dicts of children by name, files are
+    (size, mod_time) tuples. Kept in memory and saved as JSON next to the other caches.
+    """
+
+    def __init__(self, remote, path=None):
+        self.remote = remote
+        self.path = path or os.path.join(DEFAULT_INDEX_DIR, f"{remote.replace(os.sep, '_')}.json")
+        self.root = {}
+        self.files = 0
+        self.built_at = 0.0  # last full listing
+        self.refreshed_at = 0.0  # last full or incremental listing
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Read the saved index, returns False if there is none."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        with self.lock:
+            self.root = self._thaw(data["root"])
+            self.files = data["files"]
+            self.built_at = data["built_at"]
+            self.refreshed_at = data["refreshed_at"]
+        return True
+
+    @classmethod
+    def _thaw(cls, node):
+        # JSON turns the file tuples into lists
+        return {name: cls._thaw(child) if isinstance(child, dict) else tuple(child) for name, child in node.items()}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"root": self.root, "files": self.files, "built_at": self.built_at,
+                           "refreshed_at": self.refreshed_at}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _insert(root, item):
+        """Add one lsjson item, returns True if it was a file not seen before."""
+        *parents, name = item["Path"].split("/")
+        node = root
+        for part in parents:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+
+        if item.get("IsDir"):
+            if not isinstance(node.get(name), dict):
+                node[name] = {}
+            return False
+        new = name not in node
+        node[name] = (item.get("Size", -1), item.get("ModTime", "")[:19].replace("T", " "))
+        return new
+
+    def build(self, items):
+        """Replace the index with a full recursive listing, the old one is served until it is complete."""
+        started = time.time()
+        root, files = {}, 0
+        for item in items:
+            files += self._insert(root, item)
+        with self.lock:
+            self.root, self.files = root, files
+            self.built_at = self.refreshed_at = started
+
+    def merge(self, items):
+        """Add or update the items of an incremental listing."""
+        started = time.time()
+        for item in items:
+            with self.lock:
+                self.files += self._insert(self.root, item)
+        with self.lock:
+            self.refreshed_at = started
+
+    def update_directory(self, path, directories, files):
+        """Replace one directory with a fresh listing, subtrees of directories still present are kept."""
+        with self.lock:
+            parent = self.root
+            for part in filter(None, path.split("/")):
+                child = parent.get(part)
+                if not isinstance(child, dict):
+                    child = parent[part] = {}
+                parent = child
+
+            old_files = sum(1 for child in parent.values() if not isinstance(child, dict))
+            subtrees = {name: parent.get(name) for name in directories}
+            parent.clear()
+            for name, subtree in subtrees.items():
+                parent[name] = subtree if isinstance(subtree, dict) else {}
+            for name, size, mod_time in files:
+                parent[name] = (size, mod_time)
+            self.files += len(files) - old_files
+
+    def _node(self, path):
+        node = self.root
+        for part in filter(None, path.split("/")):
+            node = node.get(part)
+            if not isinstance(node, dict):
+                return None
+        return node
+
+    def listing(self, path):
+        """(directories, files) of a path as sorted lists of (name, size, mod_time), None if it is not indexed."""
+        with self.lock:
+            node = self._node(path)
+            if node is None:
+                return None
+            directories = sorted((name, -1, "") for name, child in node.items() if isinstance(child, dict))
+            files = sorted((name,) + child for name, child in node.items() if not isinstance(child, dict))
+        return directories, files
+
+    def search(self, pattern, limit=SEARCH_LIMIT):
+        """
+        Paths whose name matches pattern, a glob if it has wildcards and a case-insensitive
+        substring otherwise. Returns [(path, is_dir), ...] of at most limit entries.
+        """
+        if any(char in pattern for char in "*?["):
+            matches = re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+        else:
+            needle = pattern.lower()
+
+            def matches(name):
+                return needle in name.lower()
+
+        results = []
+        with self.lock:
+            pending = [("", self.root)]
+            while pending and len(results) < limit:
+                prefix, node = pending.pop()
+                for name, child in node.items():
+                    is_dir = isinstance(child, dict)
+                    if matches(name):
+                        results.append((f"{prefix}{name}", is_dir))
+                        if len(results) >= limit:
+                            break
+                    if is_dir:
+                        pending.append((f"{prefix}{name}/", child))
+        return sorted(results)
@@ -0,0 +1,147 @@
+import json
+import time
+import shlex
+import posixpath
+import threading
+
+RC_ADDR = "localhost:5572"  # rclone rcd listens here on the server, only reachable through SSH
+DEFAULT_TRANSFERS = 8
+DEFAULT_CHECKERS = 16
+POLL_INTERVAL = 5  # seconds between progress polls while jobs are running
+DAEMON_START_TIMEOUT = 10
+RC_USER = "servertools"
+# On the server, readable only by its owner. The password is only ever read by the remote shell, so it
+# never shows up in a command line that other users could see in ps.
+RC_PASS_FILE = '"$HOME/.config/servertools/rclone_rc.pass"'
+
+
+class TransferQueue:
+    """
+    Copies submitted as async jobs to an `rclone rcd` on the server, so any number of them
+    run at once while browsing continues. Progress is polled in aggregate from core/stats.
+    `run` executes a shell command on the server and returns (stdout, stderr).
+    """
+
+    def __init__(self, run, rc_addr=RC_ADDR, transfers=DEFAULT_TRANSFERS, checkers=DEFAULT_CHECKERS):
+        self.run = run
+        self.rc_addr = rc_addr
+        self.transfers = transfers
+        self.checkers = checkers
+        self.jobs = {}  # jobid -> description
+        self.finished = []  # (description, success, error) not yet shown to the user
+        self.stats = {}
+        self.error = None
+        self.daemon_checked = False
+        self.poller = None
+        self.lock = threading.Lock()
+
+    def rc(self, command, params=None, auth=True):
+        line = f"rclone rc --url http://{self.rc_addr}/ {command}"
+        if auth:
+            line = f'RCLONE_USER={RC_USER} RCLONE_PASS="$(cat {RC_PASS_FILE} 2>/dev/null)" {line}'
+        if params:
+            line += f" --json {shlex.quote(json.dumps(params))}"
+        stdout, stderr = self.run(line)
+        try:
+            return json.loads(stdout)
+        except ValueError:
+            raise RuntimeError(stderr.strip() or f"rclone rc {command} gave no answer")
+
+    def ensure_daemon(self):
+        """
+        Start rclone rcd on the server unless one already answers on rc_addr with our credentials.
+        Every start generates a new random password, kept in RC_PASS_FILE for later sessions.
+        An rcd that answers without credentials was not started here and is left alone, jobs are
+        never sent to it.
+        """
+        if self.daemon_checked:
+            return
+        try:
+            self.rc("rc/noop", auth=False)
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError(f"an rclone rcd without authentication answers on {self.rc_addr}, "
+                               f"pass another --rc-addr to start a separate one")
+
+        try:
+            self.rc("rc/noop")
+        except RuntimeError:
+            self.run(
+                f"umask 077 && mkdir -p \"$(dirname {RC_PASS_FILE})\" && "
+                f"head -c 32 /dev/urandom | base64 > {RC_PASS_FILE} && "
+                f"{{ RCLONE_RC_USER={RC_USER} RCLONE_RC_PASS=\"$(cat {RC_PASS_FILE})\" "
+                f"nohup rclone rcd --rc-addr {self.rc_addr} >/dev/null 2>&1 & }}"
+            )
+            deadline = time.monotonic() + DAEMON_START_TIMEOUT
+            while True:
+                time.sleep(0.5)
+                try:
+                    self.rc("rc/noop")
+                    break
+                except RuntimeError as e:
+                    if time.monotonic() > deadline:
+                        # Most likely someone else's rcd holds the address with other credentials
+                        raise RuntimeError(f"rclone rcd did not start on {self.rc_addr} ({e}), "
+                                           f"pass another --rc-addr if it is in use") from e
+        self.daemon_checked = True
+
+    def submit(self, remote, path, is_dir, destination, transfers=None, checkers=None):
+        """Queue one copy, directories land in destination/<name>. Returns the rc job ID."""
+        self.ensure_daemon()
+        config = {"Transfers": transfers or self.transfers, "Checkers": checkers or self.checkers}
+        if is_dir:
+            command = "sync/copy"
+            params = {"srcFs": f"{remote}:{path}", "dstFs": posixpath.join(destination, posixpath.basename(path))}
+        else:
+            directory, name = posixpath.split(path)
+            command = "operations/copyfile"
+            params = {"srcFs": f"{remote}:{directory}", "srcRemote": name, "dstFs": destination, "dstRemote": name}
+        params.update({"_async": True, "_config": config})
+
+        jobid = self.rc(command, params)["jobid"]
+        with self.lock:
+            self.jobs[jobid] = f"{remote}:{path}"
+            if self.poller is None or not self.poller.is_alive():
+                self.poller = threading.Thread(target=self._poll_loop, name="transfer-poll", daemon=True)
+                self.poller.start()
+        return jobid
+
+    def poll(self):
+        stats = self.rc("core/stats")
+        with self.lock:
+            jobids = list(self.jobs)
+        for jobid in jobids:
+            status = self.rc("job/status", {"jobid": jobid})
+            if status.get("finished"):
+                with self.lock:
+                    # The poll thread and the menu may both have seen this job finish
+                    description = self.jobs.pop(jobid, None)
+                    if description is not None:
+                        self.finished.append((description, status.get("success"), status.get("error")))
+        with self.lock:
+            self.stats = stats
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            try:
+                self.poll()
+                self.error = None
+            except Exception as e:
+                # SSH hiccups included, the thread is the only thing watching the jobs
+                self.error = str(e) or type(e).__name__
+            with self.lock:
+                if not self.jobs:
+                    self.poller = None
+                    return
+
+    def running(self):
+        """Snapshot of the unfinished jobs as {jobid: description}."""
+        with self.lock:
+            return dict(self.jobs)
+
+    def take_finished(self):
+        with self.lock:
+            finished, self.finished = self.finished, []
+        return finished
@@ -0,0 +1,157 @@
+import os
+import time
+import logging
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from commons.jellyfin_client import get_client
+
+load_dotenv()
+
+# Same variables Jellyfin/arrowverse.py reads
+JELLYFIN_SERVER = os.getenv("JELLYFIN_SERVER")
+API_KEY = os.getenv("API_KEY")
+
+VIDEO_ITEM_TYPES = "Movie,Video,Episode,MusicVideo"
+DEFAULT_PAGE_SIZE = 200
+MIN_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 2000
+TARGET_PAGE_SECONDS = 1.0  # page size is adapted so a page takes about this long
+DEFAULT_PAGE_WORKERS = 4
+DEFAULT_REFRESH_RATE = 5.0  # refresh calls per second
+REFRESH_BATCH_SIZE = 25  # items refreshed before pausing for BATCH_PAUSE
+BATCH_PAUSE = 2.0
+
+
+def map_path(path, path_map):
+    """Translate a local path to the path Jellyfin sees, path_map is [(local_prefix, jellyfin_prefix), ...]."""
+    for local_prefix, jellyfin_prefix in path_map or ():
+        if path.startswith(local_prefix):
+            return jellyfin_prefix + path[len(local_prefix):]
+    return path
+
+
+def get_page(path, params, start_index, limit):
+    """Fetch one page of a query, returns (json, seconds taken)."""
+    page_params = dict(params, StartIndex=start_index, Limit=limit)
+    started = time.monotonic()
+    response = get_client().get(path, params=page_params)
+    return response.json(), time.monotonic() - started
+
+
+def adapt_page_size(page_size, elapsed):
+    """Scale the page size towards TARGET_PAGE_SECONDS, at most doubling or halving per page."""
+    scale = min(2.0, max(0.5, TARGET_PAGE_SECONDS / max(elapsed, 0.001)))
+    return min(MAX_PAGE_SIZE, max(MIN_PAGE_SIZE, int(page_size * scale)))
+
+
+def iter_items(path, params, page_size=DEFAULT_PAGE_SIZE, workers=DEFAULT_PAGE_WORKERS):
+    """
+    Yield every item of a paged Jellyfin query in order.
+    The first page tells TotalRecordCount, the remaining pages are fetched by up to `workers`
+    requests in flight while the page size follows the measured response time.
+    Only the pages in flight are held in memory.
+    """
+    data, elapsed = get_page(path, params, 0, page_size)
+    items = data.get("Items", [])
+    total = data.get("TotalRecordCount", len(items))
+    yield from items
+
+    start = len(items)
+    if not items or start >= total:
+        return
+
+    page_size = adapt_page_size(page_size, elapsed)
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while start < total or in_flight:
+                while start < total and len(in_flight) < workers:
+                    in_flight.append(executor.submit(get_page, path, params, start, page_size))
+                    start += page_size
+
+                data, elapsed = in_flight.popleft().result()
+                page_size = adapt_page_size(page_size, elapsed)
+                yield from data.get("Items", [])
+        finally:
+            # Stopped early by the caller or an error, drop pages that have not started yet
+            for future in in_flight:
+                future.cancel()
+
+
+def find_items_by_path(paths):
+    """Return {path: item_id} for the given media paths known to Jellyfin."""
+    wanted = set(paths)
+    found = {}
+    params = {
+        "Recursive": "true",
+        "IncludeItemTypes": VIDEO_ITEM_TYPES,
+        "Fields": "Path",
+        "EnableImages": "false",
+        "EnableUserData": "false"
+    }
+
+    for item in iter_items("/Items", params, page_size=MAX_PAGE_SIZE):
+        if item.get("Path") in wanted:
+            found[item["Path"]] = item["Id"]
+            if len(found) == len(wanted):
+                break
+
+    return found
+
+
+def refresh_item(item_id):
+    """Ask Jellyfin to re-read local metadata and images of a single item."""
+    params = {
+        "metadataRefreshMode": "Default",
+        "imageRefreshMode": "Default",
+        "replaceAllMetadata": "false",
+        "replaceAllImages": "false"
+    }
+    get_client().post(f"/Items/{item_id}/Refresh", params=params)
+
+
+def report_media_updated(paths, update_type="Created"):
+    """
+    Tell Jellyfin that files changed or appeared. It finds the items behind the paths itself
+    and refreshes them or picks new ones up, without a library scan.
+    """
+    body = {"Updates": [{"Path": path, "UpdateType": update_type} for path in paths]}
+    get_client().post("/Library/Media/Updated", json=body)
+
+
+def refresh_paths(paths, path_map=None, rate=DEFAULT_REFRESH_RATE):
+    """
+    Refresh only the Jellyfin items behind the given local media paths.
+    The paths are reported as modified in one request. Only if the server refuses that are the
+    items looked up by walking the library and refreshed one by one.
+    Returns (refreshed, reported) counts, reported being paths Jellyfin was told about.
+    """
+    if not JELLYFIN_SERVER or not API_KEY:
+        raise RuntimeError("JELLYFIN_SERVER and API_KEY must be set to refresh Jellyfin items.")
+
+    jellyfin_paths = {map_path(path, path_map): path for path in paths}
+    try:
+        report_media_updated(list(jellyfin_paths), update_type="Modified")
+        return 0, len(jellyfin_paths)
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Reporting changed paths failed ({e}), looking the items up instead.")
+
+    items = find_items_by_path(jellyfin_paths)
+
+    refreshed = 0
+    interval = 1.0 / rate
+    for index, item_id in enumerate(items.values(), 1):
+        try:
+            refresh_item(item_id)
+            refreshed += 1
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Failed to refresh item {item_id}: {e}")
+        time.sleep(BATCH_PAUSE if index % REFRESH_BATCH_SIZE == 0 else interval)
+
+    unknown = len(jellyfin_paths) - len(items)
+    if unknown:
+        logging.warning(f"{unknown} paths are not in Jellyfin yet, they show up with the next library scan.")
+
+    return refreshed, 0
@@ -0,0 +1,136 @@
+import os
+import re
+import time
+import bisect
+import threading
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+load_dotenv()
+
+DEFAULT_TIMEOUT = (5, 60)  # (connect, read) seconds
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+POOL_SIZE = 16
+# Upper bounds in seconds of the latency histogram buckets, the last bucket takes everything slower
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Item, user and playlist IDs are folded out of paths so they share one histogram per endpoint
+ID_PATTERN = re.compile(r'/[0-9a-fA-F]{32}(?=/|$)|/[0-9a-fA-F-]{36}(?=/|$)|/\d+(?=/|$)')
+
+
+def endpoint_name(method, path):
+    return f"{method} {ID_PATTERN.sub('/{id}', path)}"
+
+
+class LatencyHistogram:
+    """Per-endpoint request counts by latency bucket, safe to share between threads."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.endpoints = {}  # endpoint -> {'counts': [...], 'total': seconds, 'max': seconds, 'errors': n}
+
+    def record(self, endpoint, seconds, failed=False):
+        with self.lock:
+            stats = self.endpoints.setdefault(
+                endpoint, {'counts': [0] * (len(self.buckets) + 1), 'total': 0.0, 'max': 0.0, 'errors': 0}
+            )
+            stats['counts'][bisect.bisect_left(self.buckets, seconds)] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['errors'] += failed
+
+    def report(self):
+        """One line per endpoint: count, errors, mean and max latency and the non-empty buckets."""
+        labels = [f"<{bound:g}s" for bound in self.buckets] + [f">={self.buckets[-1]:g}s"]
+        lines = []
+        with self.lock:
+            for endpoint, stats in sorted(self.endpoints.items()):
+                count = sum(stats['counts'])
+                histogram = ' '.join(f"{label}:{n}" for label, n in zip(labels, stats['counts']) if n)
+                lines.append(f"{endpoint}: {count} requests, {stats['errors']} failed, "
+                             f"mean {stats['total'] / count:.3f}s, max {stats['max']:.3f}s [{histogram}]")
+        return lines
+
+
+class JellyfinClient:
+    """
+    Keep-alive session to one Jellyfin server, authenticated with the API key header.
+    Idempotent requests are retried with backoff on 5xx responses and connection resets,
+    every request is timed into a per-endpoint latency histogram.
+    """
+
+    def __init__(self, server=None, api_key=None, timeout=DEFAULT_TIMEOUT, retries=MAX_RETRIES,
+                 pool_size=POOL_SIZE):
+        self.server = (server or os.getenv("JELLYFIN_SERVER") or "").rstrip('/')
+        self.timeout = timeout
+        self.latency = LatencyHistogram()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=('GET', 'HEAD', 'DELETE'),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['X-Emby-Token'] = api_key or os.getenv("API_KEY") or ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def url(self, path):
+        return f"{self.server}{path}"
+
+    def request(self, method, path, **kwargs):
+        """Send a request and return the response whatever its status."""
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(method, path)
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+        except requests.exceptions.RequestException:
+            self.latency.record(endpoint, time.monotonic() - started, failed=True)
+            raise
+        self.latency.record(endpoint, time.monotonic() - started, failed=response.status_code >= 400)
+        return response
+
+    def get(self, path, params=None, **kwargs):
+        response = self.request('GET', path, params=params, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def post(self, path, params=None, json=None, **kwargs):
+        response = self.request('POST', path, params=params, json=json, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def delete(self, path, params=None, **kwargs):
+        response = self.request('DELETE', path, params=params, **kwargs)
+        response.raise_for_status()
+        return response
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client for JELLYFIN_SERVER and API_KEY, created on first use."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = JellyfinClient()
+        return _default_client
@@ -0,0 +1,193 @@
+import os
+import sqlite3
+import logging
+from commons.jellyfin import MAX_PAGE_SIZE, iter_items
+from commons.jellyfin_client import get_client
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'servertools', 'jellyfin.sqlite3')
+SNAPSHOT_ITEM_TYPES = "Series,Season,Episode"
+SNAPSHOT_FIELDS = "PremiereDate,Path,DateLastSaved,ParentId"
+COMMIT_EVERY = 1000
+
+
+def snapshot_row(item):
+    """Flatten a Series, Season or Episode item into an items table row."""
+    name = (item.get("Name") or "").strip()
+    if item["Type"] == "Series":
+        series_id, series_name, season_id, season, episode = item["Id"], name, None, None, None
+    elif item["Type"] == "Season":
+        series_id, series_name, season_id, season, episode = (
+            item.get("SeriesId"), item.get("SeriesName"), item["Id"], item.get("IndexNumber"), None
+        )
+    else:
+        series_id, series_name, season_id, season, episode = (
+            item.get("SeriesId"), item.get("SeriesName"), item.get("SeasonId"),
+            item.get("ParentIndexNumber"), item.get("IndexNumber")
+        )
+    return (item["Id"], item["Type"], name, series_id, series_name, season_id, season, episode,
+            item.get("PremiereDate"), item.get("Path"), item.get("DateLastSaved"))
+
+
+class LibrarySnapshot:
+    """
+    Local SQLite copy of the Jellyfin users, series, seasons and episodes.
+
+    After the first full pull, sync() only asks for items saved since the newest DateLastSaved it has
+    seen. Deletions are caught by comparing the server's item count with the local one, and only on a
+    mismatch the ID list is pulled to drop what is gone.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                name TEXT,
+                series_id TEXT,
+                series_name TEXT,
+                season_id TEXT,
+                season_number INTEGER,
+                episode_number INTEGER,
+                premiere_date TEXT,
+                path TEXT,
+                date_saved TEXT
+            );
+            CREATE INDEX IF NOT EXISTS items_series ON items (series_id, type);
+            CREATE INDEX IF NOT EXISTS items_name ON items (type, name);
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_state(self, key):
+        row = self.connection.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, value))
+
+    def sync(self, full=False):
+        """Pull users and the items changed since the last sync, returns the number of items stored."""
+        self.sync_users()
+
+        params = {
+            "Recursive": "true",
+            "IncludeItemTypes": SNAPSHOT_ITEM_TYPES,
+            "Fields": SNAPSHOT_FIELDS,
+            "EnableImages": "false",
+            "EnableUserData": "false"
+        }
+        watermark = None if full else self.get_state("date_last_saved")
+        if watermark:
+            params["MinDateLastSaved"] = watermark
+        else:
+            self.connection.execute("DELETE FROM items")
+
+        # A full pull replaces the items in one transaction, so an interrupted pull leaves the old
+        # snapshot in place. Incremental pulls only add rows and commit as they go.
+        stored = 0
+        rows = []
+        newest = watermark or ""
+        try:
+            for item in iter_items("/Items", params, page_size=MAX_PAGE_SIZE):
+                rows.append(snapshot_row(item))
+                newest = max(newest, item.get("DateLastSaved") or "")
+                if len(rows) >= COMMIT_EVERY:
+                    stored += self._store(rows, commit=bool(watermark))
+            stored += self._store(rows, commit=bool(watermark))
+        except BaseException:
+            self.connection.rollback()
+            raise
+
+        if newest:
+            self.set_state("date_last_saved", newest)
+        self.connection.commit()
+
+        if watermark:
+            self.prune(params)
+        return stored
+
+    def _store(self, rows, commit=True):
+        count = len(rows)
+        self.connection.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        if commit:
+            self.connection.commit()
+        rows.clear()
+        return count
+
+    def sync_users(self):
+        response = get_client().get("/Users")
+        self.connection.execute("DELETE FROM users")
+        self.connection.executemany(
+            "INSERT INTO users VALUES (?, ?)", [(user["Id"], user["Name"]) for user in response.json()]
+        )
+        self.connection.commit()
+
+    def prune(self, params):
+        """Drop local items deleted on the server, the ID list is only pulled when the counts differ."""
+        params = {key: value for key, value in params.items() if key not in ("MinDateLastSaved", "Fields")}
+        response = get_client().get("/Items", params=dict(params, Limit=0))
+        remote_count = response.json().get("TotalRecordCount", 0)
+        local_count = self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        if remote_count == local_count:
+            return
+
+        remote_ids = {item["Id"] for item in iter_items("/Items", params, page_size=MAX_PAGE_SIZE)}
+        local_ids = {row[0] for row in self.connection.execute("SELECT id FROM items")}
+        gone = local_ids - remote_ids
+        self.connection.executemany("DELETE FROM items WHERE id = ?", [(item_id,) for item_id in gone])
+        self.connection.commit()
+        logging.info(f"Removed {len(gone)} items deleted from Jellyfin.")
+
+    def user_id(self, user_name):
+        row = self.connection.execute("SELECT id FROM users WHERE name = ?", (user_name,)).fetchone()
+        return row[0] if row else None
+
+    def series_ids(self, series_names):
+        """Return {name: series_id} for the names present in the snapshot."""
+        placeholders = ','.join('?' * len(series_names))
+        rows = self.connection.execute(
+            f"SELECT name, id FROM items WHERE type = 'Series' AND name IN ({placeholders})", list(series_names)
+        )
+        return dict(rows.fetchall())
+
+    def episodes(self, series_ids):
+        """Episodes of the given series that have a premiere date, in the shape arrowverse.py uses."""
+        placeholders = ','.join('?' * len(series_ids))
+        rows = self.connection.execute(
+            f"SELECT id, series_id, name, series_name, season_number, episode_number, premiere_date FROM items "
+            f"WHERE type = 'Episode' AND premiere_date IS NOT NULL AND series_id IN ({placeholders})",
+            list(series_ids)
+        )
+        return [
+            {"id": item_id, "series_id": series_id, "title": name, "show": show, "season": season,
+             "episode": episode, "air_date": air_date}
+            for item_id, series_id, name, show, season, episode, air_date in rows
+        ]
+
+    def summary(self):
+        counts = dict(self.connection.execute("SELECT type, COUNT(*) FROM items GROUP BY type").fetchall())
+        users = self.connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        return (f"Snapshot: {users} users, {counts.get('Series', 0)} series, {counts.get('Season', 0)} seasons, "
+                f"{counts.get('Episode', 0)} episodes (last saved {self.get_state('date_last_saved') or 'never'}).")
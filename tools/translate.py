@@ -1,59 +1,318 @@
 #!/usr/bin/env python3
 
+import os
+import re
 import sys
+import copy
+import random
+import sqlite3
 import asyncio
+import argparse
 import xml.etree.ElementTree as ET
 from googletrans import Translator
-from tqdm.asyncio import tqdm_asyncio
+from googletrans.constants import LANGUAGES, LANGCODES, SPECIAL_CASES
+from tqdm import tqdm
 
-async def translate_text(translator, text, src_lang, dest_lang):
-    try:
-        translated = await translator.translate(text, src=src_lang, dest=dest_lang)
-        return translated.text
-    except Exception as e:
-        print(f"⚠️ Error translating '{text}': {e}")
-        return text
+DEFAULT_MEMORY_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'servertools', 'translation_memory.sqlite3')
+DEFAULT_CONCURRENCY = 4  # requests in flight at once
+DEFAULT_BATCH_CHARS = 1000  # source characters packed into one request
+MAX_BATCH_STRINGS = 25
+DEFAULT_RETRIES = 5
+LANG_PLACEHOLDER = "{lang}"  # replaced by the target language in the output path
+# Strings of a batch go one per line behind a numbered marker, and the answer is only used if every
+# marker comes back in order. Strings with a newline, outer whitespace or a marker are always sent alone.
+BATCH_SEPARATOR = "\n"
+BATCH_MARKER = "[[{}]] "
+BATCH_MARKER_PATTERN = re.compile(r"\[\[(\d+)\]\]")
 
-async def main():
-    if len(sys.argv) != 5:
-        print("Usage: python translate.py input.xml output.xml from_lang to_lang")
-        return
 
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-    src_lang = sys.argv[3]
-    dest_lang = sys.argv[4]
+class TranslationMemory:
+    """Persistent translations keyed by (source lang, target lang, source text)."""
+
+    def __init__(self, path=DEFAULT_MEMORY_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                src_lang TEXT NOT NULL,
+                dest_lang TEXT NOT NULL,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                PRIMARY KEY (src_lang, dest_lang, source)
+            )
+            """
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, src_lang, dest_lang, texts):
+        """Return {source: translation} for the texts already translated."""
+        found = {}
+        for start in range(0, len(texts), 500):
+            chunk = texts[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(self.connection.execute(
+                f"SELECT source, translation FROM translations "
+                f"WHERE src_lang = ? AND dest_lang = ? AND source IN ({placeholders})",
+                [src_lang, dest_lang] + chunk
+            ).fetchall())
+        return found
+
+    def store(self, src_lang, dest_lang, translations):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+            [(src_lang, dest_lang, source, translation) for source, translation in translations.items()]
+        )
+        self.connection.commit()
+
+
+def split_batch(batch, joined):
+    """
+    Map a translated batch back to its strings, {} unless exactly the markers 0..n-1 came back in
+    order, so lines that were merged, split or reordered are never assigned to the wrong string.
+    """
+    parts = BATCH_MARKER_PATTERN.split(joined)
+    indexes, translations = parts[1::2], parts[2::2]
+    if parts[0].strip() or indexes != [str(index) for index in range(len(batch))]:
+        return {}
+    translations = [translation.strip() for translation in translations]
+    if not all(translations):
+        return {}
+    return dict(zip(batch, translations))
+
+
+def is_language(code, allow_auto=False):
+    """Whether googletrans accepts code as a language, the same normalization it applies itself."""
+    code = code.lower().split("_", 1)[0]
+    return (allow_auto and code == "auto") or code in LANGUAGES or code in SPECIAL_CASES or code in LANGCODES
+
+
+class TranslationEngine:
+    """
+    Translates many strings with at most `concurrency` requests in flight. Short strings are packed
+    into one request per batch behind numbered [[N]] markers, and a batch whose markers do not all
+    come back in order is translated string by string instead. Failed requests are retried with
+    jittered backoff and strings that still fail are collected in `failed`.
+    """
+
+    def __init__(self, translator, concurrency=DEFAULT_CONCURRENCY, batch_chars=DEFAULT_BATCH_CHARS,
+                 retries=DEFAULT_RETRIES):
+        self.translator = translator
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.batch_chars = batch_chars
+        self.retries = retries
+        self.failed = {}  # (target lang, source text) -> last error
+
+    def batches(self, texts):
+        batch, size = [], 0
+        for text in texts:
+            if BATCH_SEPARATOR in text or text != text.strip() or BATCH_MARKER_PATTERN.search(text):
+                yield [text]
+                continue
+            if batch and (size + len(text) > self.batch_chars or len(batch) >= MAX_BATCH_STRINGS):
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text) + len(BATCH_SEPARATOR)
+        if batch:
+            yield batch
+
+    async def request(self, text, src_lang, dest_lang):
+        # The slot stays taken while backing off, so a rate limit slows every request down
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    translated = await self.translator.translate(text, src=src_lang, dest=dest_lang)
+                    return translated.text
+                except Exception:
+                    # Languages are checked before starting, so anything else may pass on a retry
+                    if attempt == self.retries:
+                        raise
+                    await asyncio.sleep(min(60.0, 2 ** attempt) + random.uniform(0, 1))
 
-    print(f"📄 Translating from {src_lang} ➝ {dest_lang}")
-    print(f"🔍 Reading: {input_file}")
+    async def translate_one(self, text, src_lang, dest_lang):
+        try:
+            return {text: await self.request(text, src_lang, dest_lang)}
+        except Exception as e:
+            self.failed[(dest_lang, text)] = str(e) or type(e).__name__
+            return {}
 
-    tree = ET.parse(input_file)
-    root = tree.getroot()
+    async def translate_batch(self, batch, src_lang, dest_lang, progress, on_batch=None):
+        results = {}
+        if len(batch) > 1:
+            try:
+                joined = await self.request(
+                    BATCH_SEPARATOR.join(BATCH_MARKER.format(index) + text for index, text in enumerate(batch)),
+                    src_lang, dest_lang
+                )
+                results = split_batch(batch, joined)
+            except Exception:
+                pass
 
-    translator = Translator()
+        if not results:
+            for result in await asyncio.gather(*(self.translate_one(text, src_lang, dest_lang) for text in batch)):
+                results.update(result)
+        if on_batch is not None and results:
+            on_batch(results)
+        progress.update(len(batch))
+        return results
 
-    elements = []
-    texts = []
+    async def translate(self, texts, src_lang, dest_lang, desc="Progress", on_batch=None, position=None):
+        """
+        Return {text: translation} for the texts that could be translated.
+        on_batch, if given, is called with the translations of every batch as soon as it is done.
+        position is the line of the progress bar when several translations run at once.
+        """
+        translations = {}
+        with tqdm(total=len(texts), desc=desc, position=position) as progress:
+            batches = [self.translate_batch(batch, src_lang, dest_lang, progress, on_batch)
+                       for batch in self.batches(texts)]
+            for result in await asyncio.gather(*batches):
+                translations.update(result)
+        return translations
 
-    for elem in root.findall("string"):
-        if elem.text:
-            elements.append(elem)
-            texts.append(elem.text)
 
-    print(f"🚀 Translating {len(texts)} strings...\n")
+def output_path(output_file, dest_lang):
+    return output_file.replace(LANG_PLACEHOLDER, dest_lang)
 
-    # Create a list of coroutines
-    tasks = [translate_text(translator, text, src_lang, dest_lang) for text in texts]
 
-    # Progress bar with asyncio.gather using tqdm_asyncio
-    translated_texts = await tqdm_asyncio.gather(*tasks, desc="Progress")
+async def translate_tree(source_tree, output_file, src_lang, dest_lang, engine, memory=None, position=None):
+    """
+    Translate a parsed strings.xml into one language and write it to output_file.
+    The source tree is left untouched, returns the number of strings left untranslated.
+    """
+    tree = copy.deepcopy(source_tree)
+    elements = [elem for elem in tree.getroot().findall("string") if elem.text]
 
-    for elem, new_text in zip(elements, translated_texts):
-        print(f"📝 {elem.attrib.get('name')}: {elem.text} ➝ {new_text}")
-        elem.text = new_text
+    # Identical strings are translated once
+    unique_texts = list(dict.fromkeys(elem.text for elem in elements))
+    translations = memory.get_many(src_lang, dest_lang, unique_texts) if memory is not None else {}
+    missing = [text for text in unique_texts if text not in translations]
 
+    print(f"🚀 [{dest_lang}] Translating {len(missing)} new strings "
+          f"({len(elements)} in file, {len(unique_texts)} unique, {len(translations)} from memory)...")
+
+    def remember(results):
+        # Stored batch by batch, so an interrupted run keeps what it already translated. A result equal
+        # to its source may be a response that was never translated and is asked again next time.
+        memory.store(src_lang, dest_lang, {text: translation for text, translation in results.items()
+                                           if translation != text or src_lang == dest_lang})
+
+    translations.update(await engine.translate(
+        missing, src_lang, dest_lang, desc=dest_lang, on_batch=None if memory is None else remember,
+        position=position
+    ))
+
+    failed = [(elem.attrib.get('name'), elem.text) for elem in elements if elem.text not in translations]
+    for elem in elements:
+        elem.text = translations.get(elem.text, elem.text)
+
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
     tree.write(output_file, encoding="utf-8", xml_declaration=True)
-    print(f"\n✅ Translation complete ➝ {output_file}")
+
+    if failed:
+        print(f"\n⚠️ [{dest_lang}] {len(failed)} strings were left untranslated in {output_file}:")
+        for name, text in failed:
+            print(f"   {name}: {text} ({engine.failed.get((dest_lang, text), 'no result')})")
+    else:
+        print(f"\n✅ [{dest_lang}] Translation complete ➝ {output_file}")
+    return len(failed)
+
+
+async def translate_file(input_file, output_file, src_lang, dest_langs, engine, memory=None):
+    """
+    Translate one strings.xml into every language of dest_langs. The source is parsed once and all
+    languages share the engine's request budget, each file is written as soon as its language is done.
+    Returns the number of strings left untranslated over all languages.
+    """
+    print(f"📄 Translating from {src_lang} ➝ {', '.join(dest_langs)}")
+    print(f"🔍 Reading: {input_file}\n")
+    source_tree = ET.parse(input_file)
+
+    failed = await asyncio.gather(*(
+        translate_tree(source_tree, output_path(output_file, dest_lang), src_lang, dest_lang, engine, memory,
+                       position=position)
+        for position, dest_lang in enumerate(dest_langs)
+    ))
+    return sum(failed)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Translate the strings of an Android strings.xml file.")
+    parser.add_argument('input_file', help='Source strings.xml.')
+    parser.add_argument(
+        'output_file',
+        help=f'Where to write the translated file, {LANG_PLACEHOLDER} is replaced by the target language '
+             f'(required with several targets), e.g. res/values-{LANG_PLACEHOLDER}/strings.xml.'
+    )
+    parser.add_argument('from_lang', help='Source language code, e.g. en.')
+    parser.add_argument('to_langs', nargs='+', help='One or more target language codes, e.g. de fr es.')
+    parser.add_argument(
+        '--memory-path',
+        default=DEFAULT_MEMORY_PATH,
+        help=f'Translation memory database (default: {DEFAULT_MEMORY_PATH}).'
+    )
+    parser.add_argument(
+        '--no-memory',
+        action='store_true',
+        help='Translate every string again without reading or updating the translation memory.'
+    )
+    parser.add_argument(
+        '-j', '--concurrency',
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f'Translation requests in flight at once, shared by all target languages (default: {DEFAULT_CONCURRENCY}).'
+    )
+    parser.add_argument(
+        '--batch-chars',
+        type=int,
+        default=DEFAULT_BATCH_CHARS,
+        help=f'Characters of short strings packed into one request, 0 sends every string alone '
+             f'(default: {DEFAULT_BATCH_CHARS}).'
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f'Retries of a failed request, with backoff (default: {DEFAULT_RETRIES}).'
+    )
+    args = parser.parse_args()
+
+    if not is_language(args.from_lang, allow_auto=True):
+        parser.error(f"unknown source language: {args.from_lang}")
+    unknown = [lang for lang in args.to_langs if not is_language(lang)]
+    if unknown:
+        parser.error(f"unknown target language(s): {', '.join(unknown)}")
+
+    to_langs = list(dict.fromkeys(args.to_langs))
+    if len(to_langs) > 1 and LANG_PLACEHOLDER not in args.output_file:
+        parser.error(f"output_file must contain {LANG_PLACEHOLDER} when translating into several languages")
+
+    # Without raise_exception googletrans answers a rate limit with the source text as the "translation"
+    engine = TranslationEngine(Translator(raise_exception=True), max(1, args.concurrency), args.batch_chars,
+                               max(0, args.retries))
+    if args.no_memory:
+        failed = await translate_file(args.input_file, args.output_file, args.from_lang, to_langs, engine)
+    else:
+        with TranslationMemory(args.memory_path) as memory:
+            failed = await translate_file(args.input_file, args.output_file, args.from_lang, to_langs, engine,
+                                          memory)
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import requests
+from yt_quota import QuotaExceeded
+
+YOUTUBE_VIDEOS_URL = "https://www.googleapis.com/youtube/v3/videos"
+MAX_IDS_PER_REQUEST = 50  # videos.list accepts at most 50 comma-separated IDs
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'servertools', 'yt_metadata.sqlite3')
+DEFAULT_CACHE_TTL_DAYS = 30
+BUSY_TIMEOUT = 30  # seconds a write waits for the other cache's connection to the same file
+
+
+def connect_cache(path):
+    """
+    Open a cache database shared by MetadataCache and ThumbnailCache. WAL lets the two
+    connections read while the other writes, and writers wait for the lock instead of failing.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+
+class MetadataCache:
+    """
+    Persistent store of raw videos.list snippets keyed by video ID.
+
+    Each row also remembers the ID list and ETag of the request that produced it, so
+    a stale batch can be revalidated with If-None-Match as a whole. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_CACHE_TTL_DAYS):
+        self.ttl = ttl_days * 86400
+        self.lock = threading.Lock()
+        self.connection = connect_cache(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS snippets (
+                video_id TEXT PRIMARY KEY,
+                snippet TEXT NOT NULL,
+                etag TEXT,
+                request_ids TEXT,
+                request_etag TEXT,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+        self.stats = {'fresh': 0, 'not_modified': 0, 'fetched': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, video_ids):
+        """Return {video_id: row} for the cached IDs, row keys match the table columns."""
+        rows = {}
+        for start in range(0, len(video_ids), 500):
+            chunk = video_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            with self.lock:
+                cursor = self.connection.execute(
+                    f"SELECT video_id, snippet, etag, request_ids, request_etag, fetched_at "
+                    f"FROM snippets WHERE video_id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+            for video_id, snippet, etag, request_ids, request_etag, fetched_at in cursor:
+                rows[video_id] = {
+                    'snippet': json.loads(snippet),
+                    'etag': etag,
+                    'request_ids': request_ids,
+                    'request_etag': request_etag,
+                    'fetched_at': fetched_at
+                }
+        return rows
+
+    def is_fresh(self, row):
+        return time.time() - row['fetched_at'] < self.ttl
+
+    def store(self, request_ids, request_etag, items):
+        """Save the items of one videos.list response."""
+        now = time.time()
+        rows = [
+            (item['id'], json.dumps(item['snippet']), item.get('etag'), request_ids, request_etag, now)
+            for item in items
+        ]
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO snippets VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def touch(self, video_ids):
+        """Mark entries as freshly validated after a 304 Not Modified."""
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE snippets SET fetched_at = ? WHERE video_id = ?",
+                [(now, video_id) for video_id in video_ids]
+            )
+            self.connection.commit()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def summary(self):
+        return (f"Metadata cache: {self.stats['fresh']} fresh, {self.stats['not_modified']} revalidated, "
+                f"{self.stats['fetched']} fetched from API.")
+
+
+class ThumbnailCache:
+    """
+    Which thumbnail resolution exists per video ID, and the validators of the poster last
+    downloaded for it. Shared by the download workers, so access is serialized.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.lock = threading.Lock()
+        self.connection = connect_cache(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                video_id TEXT PRIMARY KEY,
+                quality TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT
+            )
+            """
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, video_id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT quality, etag, last_modified FROM thumbnails WHERE video_id = ?", (video_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'quality': row[0], 'etag': row[1], 'last_modified': row[2]}
+
+    def put(self, video_id, quality, etag=None, last_modified=None):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?)", (video_id, quality, etag, last_modified)
+            )
+            self.connection.commit()
+
+
+def parse_snippet(snippet):
+    """Convert a videos.list snippet into the metadata dict used for NFOs."""
+    return {
+        'title': snippet['title'],
+        'description': snippet['description'],
+        'upload_date': snippet['publishedAt'][:10],
+        'channel_title': snippet['channelTitle'],
+        'tags': snippet.get('tags', [])
+    }
+
+
+def request_videos(video_ids, api_key, etag=None, scheduler=None):
+    """Issue one videos.list call, conditional on etag if given and paced by the quota scheduler if any."""
+    params = {'part': 'snippet', 'id': ','.join(video_ids), 'key': api_key}
+    headers = {'If-None-Match': etag} if etag else {}
+    if scheduler is not None:
+        return scheduler.get(YOUTUBE_VIDEOS_URL, params=params, headers=headers)
+    return requests.get(YOUTUBE_VIDEOS_URL, params=params, headers=headers)
+
+
+def revalidate_stale(stale, wanted, api_key, cache, scheduler=None, snippets=None):
+    """
+    Revalidate stale rows, grouped by the request that produced them.
+    Resolved IDs are added to snippets, the rest need a plain fetch.
+    """
+    snippets = {} if snippets is None else snippets
+    groups = {}
+    for video_id, row in stale.items():
+        groups.setdefault((row['request_ids'], row['request_etag']), []).append(video_id)
+
+    for (request_ids, request_etag), video_ids in groups.items():
+        batch_ids = request_ids.split(',') if request_ids else []
+        # The stored ETag only applies to the exact same request, so every member must be wanted again
+        if not request_etag or not batch_ids or any(batch_id not in wanted for batch_id in batch_ids):
+            continue
+
+        response = request_videos(batch_ids, api_key, etag=request_etag, scheduler=scheduler)
+        if response.status_code == 304:
+            cache.touch(video_ids)
+            cache.count('not_modified', len(video_ids))
+            for video_id in video_ids:
+                snippets[video_id] = stale[video_id]['snippet']
+        elif response.status_code == 200:
+            data = response.json()
+            items = data.get('items', [])
+            cache.store(request_ids, data.get('etag'), items)
+            cache.count('fetched', len(items))
+            for item in items:
+                snippets[item['id']] = item['snippet']
+            # IDs missing from a 200 response were removed upstream, keep serving the last known copy
+            for video_id in video_ids:
+                snippets.setdefault(video_id, stale[video_id]['snippet'])
+
+
+def fetch_youtube_metadata_batch(video_ids, api_key, cache=None, scheduler=None):
+    """
+    Fetch metadata for many videos from YouTube Data API.
+    Fresh cache entries are served locally, stale ones are revalidated with If-None-Match
+    and the remaining IDs are resolved in chunks of 50 per request. Returns {video_id: metadata}.
+
+    If the quota scheduler runs out of budget, QuotaExceeded is raised with the metadata
+    resolved so far in its `results`.
+    """
+    snippets = {}
+    stale = {}
+    to_fetch = list(video_ids)
+
+    try:
+        if cache is not None:
+            cached = cache.get_many(to_fetch)
+            for video_id, row in cached.items():
+                if cache.is_fresh(row):
+                    snippets[video_id] = row['snippet']
+                    cache.count('fresh')
+                else:
+                    stale[video_id] = row
+            if stale:
+                revalidate_stale(stale, set(to_fetch), api_key, cache, scheduler, snippets)
+            to_fetch = [video_id for video_id in to_fetch if video_id not in snippets]
+
+        for start in range(0, len(to_fetch), MAX_IDS_PER_REQUEST):
+            chunk = to_fetch[start:start + MAX_IDS_PER_REQUEST]
+            response = request_videos(chunk, api_key, scheduler=scheduler)
+            if response.status_code != 200:
+                print(f"Failed to fetch metadata batch of {len(chunk)} IDs (HTTP {response.status_code})")
+                continue
+            data = response.json()
+            items = data.get('items', [])
+            if cache is not None:
+                cache.store(','.join(chunk), data.get('etag'), items)
+                cache.count('fetched', len(items))
+            for item in items:
+                snippets[item['id']] = item['snippet']
+    except QuotaExceeded as e:
+        e.results = resolve(snippets, stale)
+        raise
+
+    return resolve(snippets, stale)
+
+
+def resolve(snippets, stale):
+    # Serve the last known copy of anything the API could not resolve right now
+    for video_id, row in stale.items():
+        snippets.setdefault(video_id, row['snippet'])
+    return {video_id: parse_snippet(snippet) for video_id, snippet in snippets.items()}
+
+
+def fetch_youtube_metadata(video_id, api_key, cache=None, scheduler=None):
+    """Fetch metadata from YouTube Data API."""
+    return fetch_youtube_metadata_batch([video_id], api_key, cache, scheduler).get(video_id)
@@ -1,78 +1,27 @@
 import os
-import re
-import requests
 import argparse
-import xml.etree.ElementTree as ET
+import yt_toolkit
 from dotenv import load_dotenv
+from yt_scanner import Manifest, DEFAULT_MANIFEST_PATH
+from yt_quota import QuotaScheduler, DEFAULT_DAILY_BUDGET, DEFAULT_RATE
+from yt_api import MetadataCache, DEFAULT_CACHE_PATH, DEFAULT_CACHE_TTL_DAYS
+from yt_toolkit import DEFAULT_API_JOBS
 
 
-def fetch_youtube_metadata(video_id, api_key):
-    """Fetch metadata from YouTube Data API."""
-    url = (
-        f"https://www.googleapis.com/youtube/v3/videos"
-        f"?part=snippet&id={video_id}&key={api_key}"
+def process_directory(directory, api_key, quiet=False, missing_only=False, cache=None, recursive=False, manifest=None,
+                      scheduler=None, api_jobs=DEFAULT_API_JOBS):
+    yt_toolkit.process_directory(
+        directory,
+        api_key,
+        silent_level=2 if quiet else 0,
+        missing_only=missing_only,
+        do_nfo=True,
+        api_jobs=api_jobs,
+        cache=cache,
+        recursive=recursive,
+        manifest=manifest,
+        scheduler=scheduler
     )
-    response = requests.get(url)
-    if response.status_code == 200:
-        items = response.json().get('items')
-        if items:
-            snippet = items[0]['snippet']
-            return {
-                'title': snippet['title'],
-                'description': snippet['description'],
-                'upload_date': snippet['publishedAt'][:10],
-                'channel_title': snippet['channelTitle'],
-                'tags': snippet.get('tags', [])
-            }
-    return None
-
-
-def write_nfo(metadata, save_path):
-    """Write metadata to an NFO file in XML format."""
-    root = ET.Element("movie")
-    ET.SubElement(root, "title").text = metadata['title']
-    ET.SubElement(root, "plot").text = metadata['description']
-    ET.SubElement(root, "premiered").text = metadata['upload_date']
-    ET.SubElement(root, "studio").text = metadata['channel_title']
-
-    for tag in metadata['tags']:
-        ET.SubElement(root, "tag").text = tag
-
-    tree = ET.ElementTree(root)
-    tree.write(save_path, encoding="utf-8", xml_declaration=True)
-
-
-def process_directory(directory, api_key, quiet=False, missing_only=False):
-    video_extensions = ('.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm')
-    id_pattern = re.compile(r'\[([A-Za-z0-9_-]{11})\]$')
-
-    for filename in os.listdir(directory):
-        base, ext = os.path.splitext(filename)
-        if ext.lower() in video_extensions:
-            match = id_pattern.search(base)
-            if match:
-                video_id = match.group(1)
-                output_filename = f"{base}.nfo"
-                save_path = os.path.join(directory, output_filename)
-
-                if missing_only and os.path.exists(save_path):
-                    if not quiet:
-                        print(f"Skipping: NFO already exists for '{filename}'.")
-                    continue
-
-                if not quiet:
-                    print(f"Fetching metadata for '{filename}'...")
-                metadata = fetch_youtube_metadata(video_id, api_key)
-
-                if metadata:
-                    write_nfo(metadata, save_path)
-                    if not quiet:
-                        print(f"Saved NFO: {output_filename}")
-                else:
-                    print(f"Failed to fetch metadata for ID: {video_id}")
-            else:
-                if not quiet:
-                    print(f"No YouTube ID found in: {filename}")
 
 
 def main():
@@ -101,6 +50,57 @@ def main():
         action='store_true',
         help='Only create NFO files if they do not exist.'
     )
+    parser.add_argument(
+        '-r', '--recursive',
+        action='store_true',
+        help='Also process all subdirectories.'
+    )
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        default=DEFAULT_MANIFEST_PATH,
+        help='Path to the scan manifest used to skip unchanged directories.'
+    )
+    parser.add_argument(
+        '--no-manifest',
+        action='store_true',
+        help='List every directory from disk.'
+    )
+    parser.add_argument(
+        '--quota-budget',
+        type=int,
+        default=DEFAULT_DAILY_BUDGET,
+        help=f'Daily YouTube API quota units this tool may spend (default: {DEFAULT_DAILY_BUDGET}).'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=DEFAULT_RATE,
+        help=f'Maximum YouTube API requests per second (default: {DEFAULT_RATE:g}).'
+    )
+    parser.add_argument(
+        '--api-jobs',
+        type=int,
+        default=DEFAULT_API_JOBS,
+        help=f'Number of concurrent YouTube API batches (default: {DEFAULT_API_JOBS}).'
+    )
+    parser.add_argument(
+        '--cache-path',
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help='Path to the SQLite metadata cache.'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=DEFAULT_CACHE_TTL_DAYS,
+        help=f'Days before a cached snippet is revalidated (default: {DEFAULT_CACHE_TTL_DAYS}).'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always fetch metadata from the API.'
+    )
 
     args = parser.parse_args()
     target_directory = os.path.abspath(os.path.expanduser(args.directory.replace('\\', '')))
@@ -114,12 +114,25 @@ def main():
     if args.missing_only and not args.quiet:
         print("Running in 'missing-only' mode: Skipping files with existing NFOs.")
 
-    process_directory(
-        target_directory,
-        api_key,
-        quiet=args.quiet,
-        missing_only=args.missing_only
-    )
+    cache = None if args.no_cache else MetadataCache(args.cache_path, args.cache_ttl)
+    manifest = None if args.no_manifest else Manifest(args.manifest)
+    try:
+        process_directory(
+            target_directory,
+            api_key,
+            quiet=args.quiet,
+            missing_only=args.missing_only,
+            cache=cache,
+            recursive=args.recursive,
+            manifest=manifest,
+            scheduler=QuotaScheduler(args.quota_budget, args.rate),
+            api_jobs=max(1, args.api_jobs)
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+        if manifest is not None:
+            manifest.save()
 
 
 if __name__ == "__main__":
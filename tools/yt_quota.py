@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import random
+import threading
+import requests
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')  # YouTube quotas reset at midnight Pacific Time
+except Exception:
+    QUOTA_TIMEZONE = timezone(timedelta(hours=-8))
+
+DEFAULT_QUOTA_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'servertools', 'yt_quota.json')
+DEFAULT_DAILY_BUDGET = 10000  # Default quota of a YouTube Data API project
+DEFAULT_RATE = 5.0  # requests per second
+MAX_RETRIES = 5
+
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+QUOTA_REASONS = ('quotaExceeded', 'dailyLimitExceeded')
+
+
+class QuotaExceeded(Exception):
+    """Raised once the daily budget is spent, `results` carries whatever was resolved before that."""
+
+    def __init__(self, message, reset_at=None):
+        super().__init__(message)
+        self.reset_at = reset_at
+        self.results = {}
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def quota_day():
+    return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+
+def next_reset():
+    now = datetime.now(QUOTA_TIMEZONE)
+    return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def error_reason(response):
+    try:
+        errors = response.json()['error']['errors']
+        return errors[0].get('reason', '') if errors else ''
+    except (ValueError, KeyError, TypeError, IndexError):
+        return ''
+
+
+class QuotaScheduler:
+    """
+    Gate for YouTube Data API calls: paces requests with a token bucket, charges a daily
+    budget persisted across runs and retries rate limiting and server errors with jittered backoff.
+    """
+
+    def __init__(self, daily_budget=DEFAULT_DAILY_BUDGET, rate=DEFAULT_RATE, state_path=DEFAULT_QUOTA_PATH,
+                 max_retries=MAX_RETRIES):
+        self.daily_budget = daily_budget
+        self.bucket = TokenBucket(rate)
+        self.state_path = state_path
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.state = {'day': quota_day(), 'used': 0}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError):
+                print(f"Ignoring unreadable quota state: {state_path}")
+
+    def remaining(self):
+        with self.lock:
+            self._roll_over()
+            return self.daily_budget - self.state['used']
+
+    def _roll_over(self):
+        today = quota_day()
+        if self.state.get('day') != today:
+            self.state = {'day': today, 'used': 0}
+
+    def _save(self):
+        if not self.state_path:
+            return
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _charge(self, cost):
+        with self.lock:
+            self._roll_over()
+            if self.state['used'] + cost > self.daily_budget:
+                raise QuotaExceeded(f"Daily quota budget of {self.daily_budget} units is spent.", next_reset())
+            self.state['used'] += cost
+            self._save()
+
+    def _refund(self, cost):
+        with self.lock:
+            self._roll_over()
+            self.state['used'] = max(0, self.state['used'] - cost)
+            self._save()
+
+    def _exhaust(self):
+        with self.lock:
+            self._roll_over()
+            self.state['used'] = max(self.state['used'], self.daily_budget)
+            self._save()
+
+    def get(self, url, params=None, headers=None, cost=1):
+        """GET through the scheduler, returns the final response or raises QuotaExceeded."""
+        for attempt in range(self.max_retries + 1):
+            self._charge(cost)
+            self.bucket.acquire()
+            try:
+                response = requests.get(url, params=params, headers=headers, timeout=30)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(attempt, f"connection error ({e})")
+                continue
+
+            if response.status_code == 403:
+                reason = error_reason(response)
+                if reason in QUOTA_REASONS:
+                    self._exhaust()
+                    raise QuotaExceeded("YouTube reported the daily quota as exceeded.", next_reset())
+                if reason not in RATE_LIMIT_REASONS:
+                    return response
+            elif response.status_code == 304:
+                # A revalidation that found the resource unchanged is not billed the full call
+                self._refund(cost)
+                return response
+            elif response.status_code != 429 and response.status_code < 500:
+                return response
+
+            if attempt == self.max_retries:
+                return response
+            self._backoff(attempt, f"HTTP {response.status_code}", response.headers.get('Retry-After'))
+
+    @staticmethod
+    def _backoff(attempt, cause, retry_after=None):
+        delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        print(f"YouTube API {cause}, retrying in {delay:.1f}s...")
+        time.sleep(delay)
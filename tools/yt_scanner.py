@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import time
+from collections import namedtuple
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm')
+ID_PATTERN = re.compile(r'\[([A-Za-z0-9_-]{11})\]$')
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'servertools', 'yt_manifest.json')
+
+# Listings younger than this may still be changing within the same mtime tick, don't trust them next run
+SETTLE_NS = 2 * 10 ** 9
+
+# video_id is None when the filename carries no [video_id], siblings is the set of names in the directory
+VideoFile = namedtuple('VideoFile', ['directory', 'filename', 'base', 'video_id', 'siblings'])
+
+
+class Manifest:
+    """
+    Per-directory record of mtime, size and the names it contained at the last scan.
+    A directory whose stat still matches is not listed again, its subdirectories are still visited.
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.directories = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.directories = json.load(f)
+            except (OSError, ValueError):
+                print(f"Ignoring unreadable manifest: {path}")
+
+    def lookup(self, directory, stat):
+        record = self.directories.get(directory)
+        if record and record['mtime_ns'] == stat.st_mtime_ns and record['size'] == stat.st_size:
+            return record
+        return None
+
+    def update(self, directory, stat, dirs, files):
+        if time.time_ns() - stat.st_mtime_ns < SETTLE_NS:
+            self.directories.pop(directory, None)
+            return
+        self.directories[directory] = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'dirs': dirs,
+            'files': files
+        }
+
+    def prune(self, root, visited):
+        """Forget directories under root that no longer exist."""
+        prefix = root.rstrip(os.sep) + os.sep
+        for directory in list(self.directories):
+            if (directory == root or directory.startswith(prefix)) and directory not in visited:
+                del self.directories[directory]
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.directories, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+def list_directory(directory):
+    """Single os.scandir pass, returns (subdirectory names, file names)."""
+    dirs, files = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+            except OSError:
+                continue
+    return dirs, files
+
+
+def scan_library(root, recursive=False, manifest=None):
+    """
+    Lazily yield a VideoFile for every video under root.
+    With a manifest, unchanged directories are served from it and cost a single stat.
+    """
+    root = os.path.abspath(root)
+    visited = set()
+    pending = [root]
+
+    while pending:
+        directory = pending.pop()
+        try:
+            stat = os.stat(directory)
+        except OSError as e:
+            print(f"Cannot access '{directory}': {e}")
+            continue
+        visited.add(directory)
+
+        record = manifest.lookup(directory, stat) if manifest is not None else None
+        if record:
+            dirs, files = record['dirs'], record['files']
+        else:
+            try:
+                dirs, files = list_directory(directory)
+            except OSError as e:
+                print(f"Cannot list '{directory}': {e}")
+                continue
+            if manifest is not None:
+                manifest.update(directory, stat, dirs, files)
+
+        siblings = frozenset(files)
+        for filename in sorted(files):
+            base, ext = os.path.splitext(filename)
+            if ext.lower() in VIDEO_EXTENSIONS:
+                match = ID_PATTERN.search(base)
+                yield VideoFile(directory, filename, base, match.group(1) if match else None, siblings)
+
+        if recursive:
+            pending.extend(os.path.join(directory, name) for name in sorted(dirs, reverse=True))
+
+    if manifest is not None and recursive:
+        manifest.prune(root, visited)
+
+
+def video_files_for(paths):
+    """Build VideoFile records for specific paths, listing each parent directory once."""
+    by_directory = {}
+    for path in paths:
+        by_directory.setdefault(os.path.dirname(path), []).append(os.path.basename(path))
+
+    for directory, filenames in by_directory.items():
+        try:
+            siblings = frozenset(os.listdir(directory))
+        except OSError as e:
+            print(f"Cannot list '{directory}': {e}")
+            continue
+        for filename in sorted(filenames):
+            base, ext = os.path.splitext(filename)
+            if ext.lower() in VIDEO_EXTENSIONS:
+                match = ID_PATTERN.search(base)
+                yield VideoFile(directory, filename, base, match.group(1) if match else None, siblings)
@@ -1,49 +1,24 @@
 import os
-import re
-import requests
 import argparse
+import yt_toolkit
+from yt_scanner import Manifest, DEFAULT_MANIFEST_PATH
+from yt_api import ThumbnailCache, DEFAULT_CACHE_PATH
+from yt_toolkit import DEFAULT_JOBS
 
-def download_thumbnail(video_id, save_path, quiet):
-    """Download YouTube thumbnail, overwrite if exists."""
-    url = f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
-    response = requests.get(url)
 
-    if response.status_code != 200:
-        url = f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-        response = requests.get(url)
-
-    if response.status_code == 200:
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
-        if not quiet:
-            print(f"Downloaded: {save_path}")
-    else:
-        print(f"Failed to download thumbnail for ID: {video_id}")
-
-def process_directory(directory, quiet=False, missing_only=False):
-    video_extensions = ('.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm')
-    id_pattern = re.compile(r'\[([A-Za-z0-9_-]{11})\]$')
-
-    for filename in os.listdir(directory):
-        base, ext = os.path.splitext(filename)
-        if ext.lower() in video_extensions:
-            match = id_pattern.search(base)
-            if match:
-                video_id = match.group(1)
-                output_filename = f"{base}-poster.jpg"
-                save_path = os.path.join(directory, output_filename)
-
-                if missing_only and os.path.exists(save_path):
-                    if not quiet:
-                        print(f"Skipping: Thumbnail already exists for '{filename}'.")
-                    continue
-
-                if not quiet:
-                    print(f"Downloading thumbnail for '{filename}'...")
-                download_thumbnail(video_id, save_path, quiet)
-            else:
-                if not quiet:
-                    print(f"No YouTube ID found in: {filename}")
+def process_directory(directory, quiet=False, missing_only=False, jobs=DEFAULT_JOBS, recursive=False, manifest=None,
+                      thumb_cache=None):
+    yt_toolkit.process_directory(
+        directory,
+        None,
+        silent_level=2 if quiet else 0,
+        missing_only=missing_only,
+        do_thumbs=True,
+        jobs=jobs,
+        recursive=recursive,
+        manifest=manifest,
+        thumb_cache=thumb_cache
+    )
 
 def main():
     parser = argparse.ArgumentParser(
@@ -64,6 +39,39 @@ def main():
         action='store_true',
         help='Only download thumbnails if the poster file does not exist.'
     )
+    parser.add_argument(
+        '-r', '--recursive',
+        action='store_true',
+        help='Also process all subdirectories.'
+    )
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        default=DEFAULT_MANIFEST_PATH,
+        help='Path to the scan manifest used to skip unchanged directories.'
+    )
+    parser.add_argument(
+        '--no-manifest',
+        action='store_true',
+        help='List every directory from disk.'
+    )
+    parser.add_argument(
+        '--cache-path',
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help='Path to the SQLite cache remembering thumbnail resolutions and validators.'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always re-download thumbnails.'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f'Number of concurrent downloads (default: {DEFAULT_JOBS}).'
+    )
 
     args = parser.parse_args()
 
@@ -80,7 +88,23 @@ def main():
         if not args.quiet:
             print("Running in 'missing-only' mode: Skipping files with existing thumbnails.")
 
-    process_directory(target_directory, quiet=args.quiet, missing_only=args.missing_only)
+    manifest = None if args.no_manifest else Manifest(args.manifest)
+    thumb_cache = None if args.no_cache else ThumbnailCache(args.cache_path)
+    try:
+        process_directory(
+            target_directory,
+            quiet=args.quiet,
+            missing_only=args.missing_only,
+            jobs=max(1, args.jobs),
+            recursive=args.recursive,
+            manifest=manifest,
+            thumb_cache=thumb_cache
+        )
+    finally:
+        if thumb_cache is not None:
+            thumb_cache.close()
+        if manifest is not None:
+            manifest.save()
 
 if __name__ == "__main__":
     main()
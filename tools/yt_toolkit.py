@@ -1,49 +1,133 @@
 import os
-import re
+import sys
 import requests
+import queue
+import functools
 import argparse
+import tempfile
+import threading
 import xml.etree.ElementTree as ET
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from yt_scanner import Manifest, scan_library, DEFAULT_MANIFEST_PATH
+from yt_watch import VideoWatcher, DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL
+from yt_quota import QuotaScheduler, QuotaExceeded, DEFAULT_DAILY_BUDGET, DEFAULT_RATE
+# commons/ lives in the repository root, which is not on the path when run as tools/yt_toolkit.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from commons import jellyfin
+except ImportError:
+    jellyfin = None
+from yt_api import MetadataCache, ThumbnailCache, fetch_youtube_metadata_batch, MAX_IDS_PER_REQUEST, DEFAULT_CACHE_PATH, DEFAULT_CACHE_TTL_DAYS
 
+DEFAULT_JOBS = 8
+DEFAULT_API_JOBS = 2
+THUMBNAIL_QUALITIES = ('maxresdefault', 'hqdefault')  # best first, hqdefault exists for every video
+CHUNK_SIZE = 64 * 1024
 
-def download_thumbnail(video_id, save_path, silent_level):
-    """Download YouTube thumbnail, overwrite if exists."""
-    url = f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        url = f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-        response = requests.get(url)
-
-    if response.status_code == 200:
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
-        if should_print('fetch', silent_level):
-            print(f"Downloaded thumbnail: {save_path}")
-    else:
-        print(f"Failed to download thumbnail for ID: {video_id}")
-
-
-def fetch_youtube_metadata(video_id, api_key):
-    """Fetch metadata from YouTube Data API."""
-    url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet&id={video_id}&key={api_key}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        items = response.json().get('items')
-        if items:
-            snippet = items[0]['snippet']
-            return {
-                'title': snippet['title'],
-                'description': snippet['description'],
-                'upload_date': snippet['publishedAt'][:10],
-                'channel_title': snippet['channelTitle'],
-                'tags': snippet.get('tags', [])
-            }
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+_DONE = object()  # end-of-stream marker passed between pipeline stages
+
+
+def create_session(pool_size=DEFAULT_JOBS):
+    """
+    Create a keep-alive session shared by all download workers.
+    Connections per host are capped at pool_size, transient errors are retried with backoff.
+    """
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET', 'HEAD')
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def thumbnail_url(video_id, quality):
+    return f"https://img.youtube.com/vi/{video_id}/{quality}.jpg"
+
+
+def probe_quality(video_id, session, thumb_cache=None):
+    """
+    Pick the best existing resolution with a HEAD request instead of a wasted GET.
+    The answer is remembered per ID when a thumbnail cache is available.
+    """
+    record = thumb_cache.get(video_id) if thumb_cache is not None else None
+    if record:
+        return record['quality'], record
+
+    for quality in THUMBNAIL_QUALITIES[:-1]:
+        if session.head(thumbnail_url(video_id, quality), timeout=30).status_code == 200:
+            return quality, None
+    return THUMBNAIL_QUALITIES[-1], None
+
+
+def atomic_write(save_path, chunks):
+    """Write chunks into a temp file next to save_path and rename it into place."""
+    fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(save_path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        # mkstemp creates 0600 files, give the result the permissions a plain open() would have
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def stream_to_file(response, save_path):
+    """Stream the body to save_path without holding it in memory."""
+    atomic_write(save_path, response.iter_content(chunk_size=CHUNK_SIZE))
+
+
+def download_thumbnail(video_id, save_path, silent_level, session=requests, thumb_cache=None):
+    """
+    Download YouTube thumbnail, overwrite if exists.
+    Returns 'downloaded', 'unchanged' (poster on disk is still current) or None on failure.
+    """
+    quality, record = probe_quality(video_id, session, thumb_cache)
+
+    headers = {}
+    if record and os.path.exists(save_path):
+        if record['etag']:
+            headers['If-None-Match'] = record['etag']
+        if record['last_modified']:
+            headers['If-Modified-Since'] = record['last_modified']
+
+    with session.get(thumbnail_url(video_id, quality), headers=headers, stream=True, timeout=30) as response:
+        if response.status_code == 304:
+            if should_print('fetch', silent_level):
+                print(f"Thumbnail unchanged: {save_path}")
+            return 'unchanged'
+
+        if response.status_code == 200:
+            stream_to_file(response, save_path)
+            if thumb_cache is not None:
+                thumb_cache.put(video_id, quality, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            if should_print('fetch', silent_level):
+                print(f"Downloaded thumbnail: {save_path}")
+            return 'downloaded'
+
+    if record and quality != THUMBNAIL_QUALITIES[-1]:
+        # The remembered resolution is gone upstream, fall back to the one that always exists
+        thumb_cache.put(video_id, THUMBNAIL_QUALITIES[-1])
+        return download_thumbnail(video_id, save_path, silent_level, session, thumb_cache)
+
+    print(f"Failed to download thumbnail for ID: {video_id}")
     return None
 
 
-def write_nfo(metadata, save_path):
-    """Write metadata to an NFO file in XML format."""
+def render_nfo(metadata):
+    """Serialize metadata to the NFO XML bytes."""
     root = ET.Element("movie")
     ET.SubElement(root, "title").text = metadata['title']
     ET.SubElement(root, "plot").text = metadata['description']
@@ -53,8 +137,26 @@ def write_nfo(metadata, save_path):
     for tag in metadata['tags']:
         ET.SubElement(root, "tag").text = tag
 
-    tree = ET.ElementTree(root)
-    tree.write(save_path, encoding="utf-8", xml_declaration=True)
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def write_nfo(metadata, save_path):
+    """
+    Write metadata to an NFO file in XML format.
+    The file is only replaced when its content changes, so Jellyfin does not see an mtime bump
+    for identical metadata. Returns True if written, False if it was already up to date.
+    """
+    data = render_nfo(metadata)
+    try:
+        if os.path.getsize(save_path) == len(data):
+            with open(save_path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except FileNotFoundError:
+        pass
+
+    atomic_write(save_path, [data])
+    return True
 
 
 def should_print(message_type, silent_level):
@@ -69,49 +171,314 @@ def should_print(message_type, silent_level):
     return True
 
 
-def process_directory(directory, api_key, silent_level=0, missing_only=False, do_thumbs=False, do_nfo=False):
-    video_extensions = ('.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm')
-    id_pattern = re.compile(r'\[([A-Za-z0-9_-]{11})\]$')
-
-    for filename in os.listdir(directory):
-        base, ext = os.path.splitext(filename)
-        if ext.lower() in video_extensions:
-            match = id_pattern.search(base)
-            if match:
-                video_id = match.group(1)
-
-                if do_thumbs:
-                    thumb_filename = f"{base}-poster.jpg"
-                    thumb_path = os.path.join(directory, thumb_filename)
-
-                    if missing_only and os.path.exists(thumb_path):
-                        if should_print('skip', silent_level):
-                            print(f"Skipping: Thumbnail exists for '{filename}'.")
-                    else:
-                        if should_print('fetch', silent_level):
-                            print(f"Downloading thumbnail for '{filename}'...")
-                        download_thumbnail(video_id, thumb_path, silent_level)
-
-                if do_nfo:
-                    nfo_filename = f"{base}.nfo"
-                    nfo_path = os.path.join(directory, nfo_filename)
-
-                    if missing_only and os.path.exists(nfo_path):
-                        if should_print('skip', silent_level):
-                            print(f"Skipping: NFO exists for '{filename}'.")
-                    else:
-                        if should_print('fetch', silent_level):
-                            print(f"Fetching metadata for '{filename}'...")
-                        metadata = fetch_youtube_metadata(video_id, api_key)
-                        if metadata:
-                            write_nfo(metadata, nfo_path)
-                            if should_print('fetch', silent_level):
-                                print(f"Saved NFO: {nfo_filename}")
-                        else:
-                            print(f"Failed to fetch metadata for ID: {video_id}")
+def process_directory(directory, api_key, silent_level=0, missing_only=False, do_thumbs=False, do_nfo=False,
+                      jobs=DEFAULT_JOBS, api_jobs=DEFAULT_API_JOBS, cache=None, recursive=False, manifest=None,
+                      scheduler=None, thumb_cache=None):
+    return process_videos(
+        scan_library(directory, recursive, manifest),
+        api_key,
+        silent_level=silent_level,
+        missing_only=missing_only,
+        do_thumbs=do_thumbs,
+        do_nfo=do_nfo,
+        jobs=jobs,
+        api_jobs=api_jobs,
+        cache=cache,
+        scheduler=scheduler,
+        thumb_cache=thumb_cache
+    )
+
+
+def process_videos(videos, api_key, silent_level=0, missing_only=False, do_thumbs=False, do_nfo=False,
+                   jobs=DEFAULT_JOBS, api_jobs=DEFAULT_API_JOBS, cache=None, scheduler=None, thumb_cache=None):
+    """
+    Run the thumbnail and NFO stages over an iterable of VideoFile.
+    Returns the set of video paths whose poster or NFO changed.
+    """
+    pipeline = Pipeline(
+        api_key,
+        silent_level=silent_level,
+        missing_only=missing_only,
+        do_thumbs=do_thumbs,
+        do_nfo=do_nfo,
+        jobs=jobs,
+        api_jobs=api_jobs,
+        cache=cache,
+        scheduler=scheduler,
+        thumb_cache=thumb_cache
+    )
+    pipeline.run(videos)
+    return pipeline.touched
+
+
+class Pipeline:
+    """
+    Single pass over the library with every stage running concurrently:
+
+        scanner -> thumbnail workers (stream posters to disk)
+                -> ID batcher -> metadata workers -> NFO writer
+
+    Stages are connected by bounded queues, so a slow stage holds back the scanner
+    instead of the whole library piling up in memory.
+    """
+
+    def __init__(self, api_key, silent_level=0, missing_only=False, do_thumbs=False, do_nfo=False,
+                 jobs=DEFAULT_JOBS, api_jobs=DEFAULT_API_JOBS, cache=None, scheduler=None, thumb_cache=None):
+        self.api_key = api_key
+        self.silent_level = silent_level
+        self.missing_only = missing_only
+        self.do_thumbs = do_thumbs
+        self.do_nfo = do_nfo
+        self.jobs = jobs
+        self.api_jobs = api_jobs
+        self.cache = cache
+        self.scheduler = scheduler
+        self.thumb_cache = thumb_cache
+
+        self.thumb_queue = queue.Queue(maxsize=jobs * 4)
+        self.id_queue = queue.Queue(maxsize=MAX_IDS_PER_REQUEST * 4)
+        self.batch_queue = queue.Queue(maxsize=api_jobs * 2)
+        self.write_queue = queue.Queue(maxsize=MAX_IDS_PER_REQUEST * 4)
+
+        self.lock = threading.Lock()
+        self.counts = {
+            'downloaded': 0, 'unchanged': 0, 'thumb_failed': 0,
+            'nfo_written': 0, 'nfo_unchanged': 0, 'nfo_failed': 0
+        }
+        self.quota_error = None
+        self.quota_skipped = 0
+        self.touched = set()  # video paths whose poster or NFO changed
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def touch(self, video_path):
+        with self.lock:
+            self.touched.add(video_path)
+
+    @staticmethod
+    def start(target, *args, count=1):
+        threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(self, videos):
+        session = create_session(self.jobs) if self.do_thumbs else None
+        thumb_workers = self.start(self.thumbnail_worker, session, count=self.jobs) if self.do_thumbs else []
+        batcher = self.start(self.batcher) if self.do_nfo else []
+        metadata_workers = self.start(self.metadata_worker, count=self.api_jobs) if self.do_nfo else []
+        writer = self.start(self.writer) if self.do_nfo else []
+
+        try:
+            self.scan(videos)
+        finally:
+            for _ in thumb_workers:
+                self.thumb_queue.put(_DONE)
+            if self.do_nfo:
+                self.id_queue.put(_DONE)
+
+        for thread in thumb_workers + batcher:
+            thread.join()
+        if session is not None:
+            session.close()
+        for _ in metadata_workers:
+            self.batch_queue.put(_DONE)
+        for thread in metadata_workers:
+            thread.join()
+        self.write_queue.put(_DONE)
+        for thread in writer:
+            thread.join()
+
+        self.report()
+
+    def scan(self, videos):
+        for video in videos:
+            video_path = os.path.join(video.directory, video.filename)
+            if not video.video_id:
+                if should_print('error', self.silent_level):
+                    print(f"No YouTube ID found in: {video.filename}")
+                continue
+
+            if self.do_thumbs:
+                thumb_filename = f"{video.base}-poster.jpg"
+                if self.missing_only and thumb_filename in video.siblings:
+                    if should_print('skip', self.silent_level):
+                        print(f"Skipping: Thumbnail exists for '{video.filename}'.")
+                else:
+                    self.thumb_queue.put((video.video_id, os.path.join(video.directory, thumb_filename), video_path))
+
+            if self.do_nfo:
+                nfo_filename = f"{video.base}.nfo"
+                if self.missing_only and nfo_filename in video.siblings:
+                    if should_print('skip', self.silent_level):
+                        print(f"Skipping: NFO exists for '{video.filename}'.")
+                else:
+                    self.id_queue.put((video.video_id, os.path.join(video.directory, nfo_filename), video_path))
+
+    def thumbnail_worker(self, session):
+        while True:
+            item = self.thumb_queue.get()
+            if item is _DONE:
+                return
+            video_id, save_path, video_path = item
+            try:
+                result = download_thumbnail(video_id, save_path, self.silent_level, session, self.thumb_cache)
+            except Exception as e:
+                # A worker that dies would leave the scanner blocked on the full queue
+                print(f"Failed to download thumbnail for ID: {video_id} ({e})")
+                result = None
+            self.count({'downloaded': 'downloaded', 'unchanged': 'unchanged'}.get(result, 'thumb_failed'))
+            if result == 'downloaded':
+                self.touch(video_path)
+
+    def batcher(self):
+        """
+        Group queued IDs into full videos.list batches, only the last one of a pass is partial.
+        How fast IDs arrive (the scanner waits on the thumbnail queue) never shrinks a batch.
+        """
+        pending = {}  # video_id -> [(nfo_path, video_path), ...]
+        while True:
+            item = self.id_queue.get()
+            if item is _DONE:
+                if pending:
+                    self.batch_queue.put(pending)
+                return
+            video_id, nfo_path, video_path = item
+            pending.setdefault(video_id, []).append((nfo_path, video_path))
+            if len(pending) >= MAX_IDS_PER_REQUEST:
+                self.batch_queue.put(pending)
+                pending = {}
+
+    def metadata_worker(self):
+        while True:
+            batch = self.batch_queue.get()
+            if batch is _DONE:
+                return
+            if self.quota_error is not None:
+                self.count_quota_skipped(len(batch))
+                continue
+
+            try:
+                results = fetch_youtube_metadata_batch(list(batch), self.api_key, self.cache, self.scheduler)
+            except QuotaExceeded as e:
+                with self.lock:
+                    if self.quota_error is None:
+                        self.quota_error = e
+                results = e.results
+                self.count_quota_skipped(sum(1 for video_id in batch if video_id not in results))
+            except Exception as e:
+                print(f"Failed to fetch metadata batch of {len(batch)} IDs ({e})")
+                results = {}
+
+            for video_id, targets in batch.items():
+                metadata = results.get(video_id)
+                if metadata:
+                    for nfo_path, video_path in targets:
+                        self.write_queue.put((metadata, nfo_path, video_path))
+                elif self.quota_error is None:
+                    print(f"Failed to fetch metadata for ID: {video_id}")
+                    self.count('nfo_failed', len(targets))
+
+    def count_quota_skipped(self, amount):
+        with self.lock:
+            self.quota_skipped += amount
+
+    def writer(self):
+        while True:
+            item = self.write_queue.get()
+            if item is _DONE:
+                return
+            metadata, nfo_path, video_path = item
+            try:
+                written = write_nfo(metadata, nfo_path)
+            except Exception as e:
+                print(f"Failed to write NFO: {nfo_path} ({e})")
+                self.count('nfo_failed')
+                continue
+            if written:
+                self.count('nfo_written')
+                self.touch(video_path)
+                if should_print('fetch', self.silent_level):
+                    print(f"Saved NFO: {os.path.basename(nfo_path)}")
             else:
-                if should_print('error', silent_level):
-                    print(f"No YouTube ID found in: {filename}")
+                self.count('nfo_unchanged')
+                if should_print('skip', self.silent_level):
+                    print(f"NFO unchanged: {os.path.basename(nfo_path)}")
+
+    def report(self):
+        counts = self.counts
+        if self.do_thumbs and should_print('fetch', self.silent_level):
+            print(f"Thumbnails: {counts['downloaded']} downloaded, {counts['unchanged']} unchanged, "
+                  f"{counts['thumb_failed']} failed.")
+        elif counts['thumb_failed']:
+            print(f"{counts['thumb_failed']} thumbnails failed.")
+
+        if self.do_nfo and should_print('fetch', self.silent_level):
+            print(f"NFOs: {counts['nfo_written']} written, {counts['nfo_unchanged']} unchanged, "
+                  f"{counts['nfo_failed']} failed.")
+            if self.cache is not None:
+                print(self.cache.summary())
+        elif counts['nfo_failed']:
+            print(f"{counts['nfo_failed']} NFOs failed.")
+
+        if self.quota_error is not None:
+            print(f"Stopped: {self.quota_error} {self.quota_skipped} videos left, "
+                  f"run again with --missing-only after {self.quota_error.reset_at:%Y-%m-%d %H:%M %Z} to resume.")
+
+
+def watch_directory(directory, api_key, silent_level=0, recursive=False, manifest=None, debounce=DEFAULT_DEBOUNCE,
+                    poll_interval=DEFAULT_POLL_INTERVAL, force_polling=False, on_processed=None, **options):
+    """
+    Process the directory once, then keep processing new videos as they land until interrupted.
+    on_processed, if given, is called with the changed video paths after every pass.
+    """
+    watcher = VideoWatcher(directory, recursive, debounce, poll_interval, manifest, force_polling)
+    # Start watching before the initial pass so nothing landing in between is missed
+    watcher.start()
+
+    try:
+        touched = process_directory(directory, api_key, silent_level=silent_level, recursive=recursive,
+                                    manifest=manifest, **options)
+        if on_processed is not None:
+            on_processed(touched)
+
+        mode = f"polling every {poll_interval:g}s" if watcher.polling else "inotify"
+        print(f"Watching '{directory}' for new videos ({mode}), press Ctrl+C to stop.")
+        for videos in watcher.batches():
+            if should_print('fetch', silent_level):
+                print(f"Processing {len(videos)} new video(s)...")
+            touched = process_videos(videos, api_key, silent_level=silent_level, **options)
+            if on_processed is not None:
+                on_processed(touched)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.stop()
+
+
+def refresh_jellyfin(touched, path_map=None):
+    """Refresh just the Jellyfin items whose poster or NFO changed."""
+    if not touched:
+        print("Jellyfin: nothing changed, no refresh needed.")
+        return
+    try:
+        refreshed, reported = jellyfin.refresh_paths(sorted(touched), path_map)
+    except (RuntimeError, requests.exceptions.RequestException) as e:
+        print(f"Error: Jellyfin refresh failed: {e}")
+        return
+    print(f"Jellyfin: reported {reported} changed file(s), refreshed {refreshed} item(s) one by one.")
+
+
+def parse_path_map(entries):
+    path_map = []
+    for entry in entries or ():
+        local_prefix, separator, jellyfin_prefix = entry.partition('=')
+        if not separator:
+            raise ValueError(f"Invalid path map '{entry}', expected LOCAL=JELLYFIN.")
+        path_map.append((local_prefix, jellyfin_prefix))
+    return path_map
 
 
 def main():
@@ -126,6 +493,11 @@ def main():
         type=str,
         help='Path to the directory containing video files.'
     )
+    parser.add_argument(
+        '-r', '--recursive',
+        action='store_true',
+        help='Also process all subdirectories.'
+    )
     parser.add_argument(
         '--thumbs',
         action='store_true',
@@ -141,6 +513,91 @@ def main():
         action='store_true',
         help='Only process files missing thumbnails or NFOs.'
     )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f'Number of concurrent thumbnail downloads (default: {DEFAULT_JOBS}).'
+    )
+    parser.add_argument(
+        '--api-jobs',
+        type=int,
+        default=DEFAULT_API_JOBS,
+        help=f'Number of concurrent YouTube API batches (default: {DEFAULT_API_JOBS}).'
+    )
+    parser.add_argument(
+        '--cache-path',
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help='Path to the SQLite metadata and thumbnail cache.'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=DEFAULT_CACHE_TTL_DAYS,
+        help=f'Days before a cached snippet is revalidated (default: {DEFAULT_CACHE_TTL_DAYS}).'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always fetch metadata from the API and re-download thumbnails.'
+    )
+    parser.add_argument(
+        '-w', '--watch',
+        action='store_true',
+        help='After the initial pass, keep running and process new or renamed videos as they appear.'
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help=f'Watch mode: seconds a file must be quiet before it is processed (default: {DEFAULT_DEBOUNCE:g}).'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help=f'Watch mode: seconds between scans when inotify is unavailable (default: {DEFAULT_POLL_INTERVAL:g}).'
+    )
+    parser.add_argument(
+        '--force-polling',
+        action='store_true',
+        help='Watch mode: poll the library even if inotify is available.'
+    )
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        default=DEFAULT_MANIFEST_PATH,
+        help='Path to the scan manifest used to skip unchanged directories.'
+    )
+    parser.add_argument(
+        '--no-manifest',
+        action='store_true',
+        help='List every directory from disk.'
+    )
+    parser.add_argument(
+        '--quota-budget',
+        type=int,
+        default=DEFAULT_DAILY_BUDGET,
+        help=f'Daily YouTube API quota units this tool may spend (default: {DEFAULT_DAILY_BUDGET}).'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=DEFAULT_RATE,
+        help=f'Maximum YouTube API requests per second (default: {DEFAULT_RATE:g}).'
+    )
+    parser.add_argument(
+        '--jellyfin-refresh',
+        action='store_true',
+        help='Refresh only the changed items in Jellyfin afterwards (uses JELLYFIN_SERVER and API_KEY).'
+    )
+    parser.add_argument(
+        '--jellyfin-path-map',
+        action='append',
+        metavar='LOCAL=JELLYFIN',
+        help='Translate a local path prefix to the one Jellyfin sees, can be repeated.'
+    )
     parser.add_argument(
         '--silent-level',
         type=int,
@@ -164,6 +621,18 @@ def main():
         print("Error: YOUTUBE_API_KEY not found in environment, required for NFO.")
         return
 
+    on_processed = None
+    if args.jellyfin_refresh:
+        if jellyfin is None:
+            print("Error: --jellyfin-refresh needs the repository root on the Python path for commons/.")
+            return
+        try:
+            path_map = parse_path_map(args.jellyfin_path_map)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        on_processed = functools.partial(refresh_jellyfin, path_map=path_map)
+
     if args.silent_level == 2:
         print("Running in full quiet mode: Only errors will be shown.")
     elif args.silent_level == 1:
@@ -171,14 +640,45 @@ def main():
     elif args.missing_only:
         print("Running in 'missing-only' mode: Skipping files with existing outputs.")
 
-    process_directory(
-        target_directory,
-        api_key,
+    cache = MetadataCache(args.cache_path, args.cache_ttl) if args.nfo and not args.no_cache else None
+    manifest = None if args.no_manifest else Manifest(args.manifest)
+    scheduler = QuotaScheduler(args.quota_budget, args.rate) if args.nfo else None
+    thumb_cache = ThumbnailCache(args.cache_path) if args.thumbs and not args.no_cache else None
+    options = dict(
         silent_level=args.silent_level,
         missing_only=args.missing_only,
         do_thumbs=args.thumbs,
-        do_nfo=args.nfo
+        do_nfo=args.nfo,
+        jobs=max(1, args.jobs),
+        api_jobs=max(1, args.api_jobs),
+        cache=cache,
+        recursive=args.recursive,
+        manifest=manifest,
+        scheduler=scheduler,
+        thumb_cache=thumb_cache
     )
+    try:
+        if args.watch:
+            watch_directory(
+                target_directory,
+                api_key,
+                debounce=args.debounce,
+                poll_interval=args.poll_interval,
+                force_polling=args.force_polling,
+                on_processed=on_processed,
+                **options
+            )
+        else:
+            touched = process_directory(target_directory, api_key, **options)
+            if on_processed is not None:
+                on_processed(touched)
+    finally:
+        if cache is not None:
+            cache.close()
+        if thumb_cache is not None:
+            thumb_cache.close()
+        if manifest is not None:
+            manifest.save()
 
 
 if __name__ == "__main__":
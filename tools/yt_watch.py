@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+from yt_scanner import VIDEO_EXTENSIONS, ID_PATTERN, scan_library, video_files_for
+
+try:
+    # watchdog uses inotify on Linux, without it the library is polled
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+DEFAULT_DEBOUNCE = 5.0
+DEFAULT_POLL_INTERVAL = 30.0
+
+
+def is_candidate(path):
+    base, ext = os.path.splitext(os.path.basename(path))
+    return ext.lower() in VIDEO_EXTENSIONS and ID_PATTERN.search(base) is not None
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.mark(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.mark(event.dest_path)
+
+    def on_modified(self, event):
+        # Keep pushing the deadline back while a pending file is still being written
+        if not event.is_directory:
+            self.watcher.mark(event.src_path, only_pending=True)
+
+
+class VideoWatcher:
+    """
+    Watch a library for new or renamed [video_id] files and hand them out in batches.
+    A path is released once no event touched it for `debounce` seconds, all settled
+    paths are coalesced into one batch.
+    """
+
+    def __init__(self, root, recursive=False, debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL,
+                 manifest=None, force_polling=False):
+        self.root = os.path.abspath(root)
+        self.recursive = recursive
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.manifest = manifest
+        self.polling = force_polling or Observer is None
+        self.pending = {}  # path -> time of the last event
+        self.lock = threading.Lock()
+        self.observer = None
+        self.known = set()
+
+    def mark(self, path, only_pending=False):
+        if not is_candidate(path):
+            return
+        with self.lock:
+            if only_pending and path not in self.pending:
+                return
+            self.pending[path] = time.monotonic()
+
+    def start(self):
+        if self.polling:
+            self.known = self.list_videos()
+        else:
+            self.observer = Observer()
+            self.observer.schedule(_EventHandler(self), self.root, recursive=self.recursive)
+            self.observer.start()
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+    def list_videos(self):
+        return {
+            os.path.join(video.directory, video.filename)
+            for video in scan_library(self.root, self.recursive, self.manifest)
+        }
+
+    def poll(self):
+        current = self.list_videos()
+        for path in current - self.known:
+            self.mark(path)
+        self.known = current
+
+    def take_settled(self):
+        now = time.monotonic()
+        with self.lock:
+            settled = [path for path, seen in self.pending.items() if now - seen >= self.debounce]
+            for path in settled:
+                del self.pending[path]
+        return [path for path in settled if os.path.exists(path)]
+
+    def batches(self):
+        """Yield lists of VideoFile until interrupted."""
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            time.sleep(1)
+            if self.polling and time.monotonic() >= next_poll:
+                self.poll()
+                next_poll = time.monotonic() + self.poll_interval
+
+            settled = self.take_settled()
+            if settled:
+                yield list(video_files_for(settled))